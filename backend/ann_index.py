@@ -0,0 +1,235 @@
+"""
+Approximate Nearest Neighbour indices for Search-Roca
+All indices share EmbeddingIndex's interface (add / search / search_batch / len):
+
+- "exact": vector_index.EmbeddingIndex (brute force, the reference)
+- "ivf":   IVF-Flat implemented locally with numpy (spherical k-means lists)
+- "hnsw":  HNSW via the optional `hnswlib` package
+
+Pick one with the ANN_BACKEND env var (default "exact"). Run this module
+to report recall@k and latency of the approximate index vs the exact one.
+"""
+import os
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from vector_index import EmbeddingIndex, top_k_indices
+
+ANN_BACKENDS = ("exact", "ivf", "hnsw")
+
+
+def _kmeans(vectors: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means (cosine) over normalized vectors, returns (k, dim) centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        # Re-seed empty lists with random points
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors are grouped by nearest centroid and stored
+    contiguously per list; a query scans only the `nprobe` closest lists.
+    """
+
+    def __init__(self, nlist: int = None, nprobe: int = 8, train_iters: int = 10, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.seed = seed
+        self._flat = EmbeddingIndex()
+        self.centroids = None
+        self._trained_size = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._flat)
+
+    def add(self, ids, vectors) -> None:
+        """Insert/overwrite rows, then regroup (retrain when the corpus doubled)"""
+        self._flat.add(ids, vectors)
+        n = len(self._flat)
+        if self.centroids is None or n >= 2 * self._trained_size:
+            nlist = self.nlist or max(1, int(np.sqrt(n)))
+            self.centroids = _kmeans(self._flat.matrix, min(nlist, n), self.train_iters, self.seed)
+            self._trained_size = n
+        assign = np.argmax(self._flat.matrix @ self.centroids.T, axis=1)
+        order = np.argsort(assign, kind='stable')
+        self.ids = self._flat.ids[order]
+        self.matrix = np.ascontiguousarray(self._flat.matrix[order])
+        counts = np.bincount(assign, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def search(self, query: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
+        if len(self) == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        probe = top_k_indices(self.centroids @ query, self.nprobe)
+        # Each list is a contiguous block: score slices directly, no gather copy
+        id_parts, score_parts = [], []
+        for c in probe:
+            start, end = self.offsets[c], self.offsets[c + 1]
+            if end > start:
+                id_parts.append(self.ids[start:end])
+                score_parts.append(self.matrix[start:end] @ query)
+        if not score_parts:
+            return []
+        ids = np.concatenate(id_parts)
+        scores = np.concatenate(score_parts)
+        top = top_k_indices(scores, top_k)
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        return [self.search(q, top_k) for q in np.asarray(queries, dtype=np.float32)]
+
+
+class HNSWIndex:
+    """HNSW graph via hnswlib (optional dependency: pip install hnswlib)"""
+
+    def __init__(self, M: int = 16, ef_construction: int = 200, ef: int = 64):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("ANN_BACKEND=hnsw requires `pip install hnswlib`") from e
+        self._hnswlib = hnswlib
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self._index = None
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, ids, vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(ids) == 0:
+            return
+        if self._index is None:
+            self._index = self._hnswlib.Index(space='ip', dim=vectors.shape[1])
+            self._index.init_index(max_elements=max(1024, 2 * len(ids)),
+                                   ef_construction=self.ef_construction, M=self.M)
+            self._index.set_ef(self.ef)
+        needed = self._index.get_current_count() + len(ids)
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(2 * needed)
+        # Existing labels are updated in place by hnswlib
+        self._index.add_items(vectors, ids)
+        self._count = self._index.get_current_count()
+
+    def search(self, query: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
+        return self.search_batch(np.asarray(query, dtype=np.float32).reshape(1, -1), top_k)[0]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        queries = np.asarray(queries, dtype=np.float32)
+        if self._count == 0:
+            return [[] for _ in range(len(queries))]
+        labels, distances = self._index.knn_query(queries, k=min(top_k, self._count))
+        # 'ip' space distance is 1 - dot product
+        return [[(int(l), float(1.0 - d)) for l, d in zip(row_l, row_d)]
+                for row_l, row_d in zip(labels, distances)]
+
+
+def create_index(backend: str = None):
+    """Index for the configured backend (ANN_BACKEND / IVF_* / HNSW_* env vars)"""
+    backend = backend or os.getenv("ANN_BACKEND", "exact")
+    if backend == "exact":
+        return EmbeddingIndex()
+    if backend == "ivf":
+        nlist = os.getenv("IVF_NLIST")
+        return IVFIndex(nlist=int(nlist) if nlist else None, nprobe=int(os.getenv("IVF_NPROBE", "8")))
+    if backend == "hnsw":
+        return HNSWIndex(M=int(os.getenv("HNSW_M", "16")), ef=int(os.getenv("HNSW_EF", "64")))
+    raise ValueError(f"Unknown ANN_BACKEND '{backend}', expected one of {ANN_BACKENDS}")
+
+
+def evaluate(approx, exact, queries: np.ndarray, top_k: int = 10) -> dict:
+    """Recall@k of `approx` against `exact` plus per-query latency of both"""
+    def timed(index):
+        results, times = [], []
+        for q in queries:
+            start = time.perf_counter()
+            results.append(index.search(q, top_k))
+            times.append((time.perf_counter() - start) * 1000)
+        return results, np.array(times)
+
+    exact_results, exact_ms = timed(exact)
+    approx_results, approx_ms = timed(approx)
+    recalls = []
+    for e, a in zip(exact_results, approx_results):
+        truth = {pid for pid, _ in e}
+        if truth:
+            recalls.append(len(truth & {pid for pid, _ in a}) / len(truth))
+    return {
+        f"recall@{top_k}": float(np.mean(recalls)) if recalls else 0.0,
+        "exact_ms_avg": float(exact_ms.mean()), "exact_ms_p95": float(np.percentile(exact_ms, 95)),
+        "approx_ms_avg": float(approx_ms.mean()), "approx_ms_p95": float(np.percentile(approx_ms, 95)),
+    }
+
+
+def _load_golden_queries() -> List[str]:
+    import json
+    poc_data = os.path.join(os.path.dirname(__file__), '..', 'poc', 'data')
+    queries = []
+    for name in ('poc_v2_golden_test_cases.json', 'poc_v5_golden_test_cases.json'):
+        path = os.path.join(poc_data, name)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                queries.extend(case['query'] for case in json.load(f))
+    return queries
+
+
+if __name__ == "__main__":
+    import argparse
+    import embeddings
+
+    parser = argparse.ArgumentParser(description="ANN recall/latency vs exact search")
+    parser.add_argument('--backend', default='ivf', choices=ANN_BACKENDS[1:])
+    parser.add_argument('--scale', type=int, default=1,
+                        help="replicate the catalog with jitter to simulate a larger corpus")
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    base = embeddings.build_text_index()
+    matrix, ids = base.matrix, base.ids
+    if args.scale > 1:
+        rng = np.random.default_rng(0)
+        matrix = np.vstack([matrix] + [matrix + rng.normal(0, 0.05, matrix.shape).astype(np.float32)
+                                       for _ in range(args.scale - 1)])
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        ids = np.arange(len(matrix))
+
+    exact = EmbeddingIndex()
+    exact.add(ids, matrix)
+    start = time.perf_counter()
+    approx = create_index(args.backend)
+    approx.add(ids, matrix)
+    build_s = time.perf_counter() - start
+
+    queries = _load_golden_queries()
+    query_vecs = np.stack([embeddings.encode_text_query(q) for q in queries])
+    report = evaluate(approx, exact, query_vecs, args.top_k)
+
+    print("=" * 50)
+    print(f"ANN '{args.backend}' vs exact | {len(matrix)} vectors | {len(queries)} golden queries")
+    print("=" * 50)
+    print(f"Build: {build_s:.2f}s")
+    for key, value in report.items():
+        print(f"  {key:<14}: {value:.4f}")
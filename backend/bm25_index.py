@@ -0,0 +1,167 @@
+"""
+BM25 Inverted Index for Search-Roca
+term -> postings (doc, tf) with doc lengths and idf. A query only touches
+documents that contain at least one query term, and top-k uses a heap.
+The index is saved as JSON so startup doesn't re-tokenize the catalog.
+"""
+import heapq
+import json
+import math
+import os
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+INDEX_FORMAT_VERSION = 1
+
+
+def simple_tokenize(text: str) -> List[str]:
+    """Lower-case whitespace split (what the PoC used)"""
+    return text.lower().split()
+
+
+class BM25Index:
+    """
+    Okapi BM25 with a non-negative idf: log(1 + (N - df + 0.5) / (df + 0.5)).
+    Documents are addressed by position internally and by `doc_ids` externally.
+    """
+
+    def __init__(self, tokenizer: Callable[[str], List[str]] = simple_tokenize,
+                 k1: float = 1.5, b: float = 0.75):
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: list = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.idf: Dict[str, float] = {}
+        self.avgdl = 0.0
+        self._norms: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], doc_ids: Optional[list] = None,
+              tokenizer: Callable[[str], List[str]] = simple_tokenize,
+              k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Tokenize and index every text"""
+        return cls.from_tokens([tokenizer(t) for t in texts], doc_ids, tokenizer, k1, b)
+
+    @classmethod
+    def from_tokens(cls, tokenized_docs: List[List[str]], doc_ids: Optional[list] = None,
+                    tokenizer: Callable[[str], List[str]] = simple_tokenize,
+                    k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Index already-tokenized documents (e.g. from a token cache)"""
+        index = cls(tokenizer, k1, b)
+        postings = defaultdict(list)
+        for doc, tokens in enumerate(tokenized_docs):
+            index.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc, tf))
+        index.postings = dict(postings)
+        index.doc_ids = list(doc_ids) if doc_ids is not None else list(range(len(tokenized_docs)))
+        if len(index.doc_ids) != len(tokenized_docs):
+            raise ValueError("doc_ids and documents length mismatch")
+        index._finalize()
+        return index
+
+    def _finalize(self) -> None:
+        n = len(self.doc_lengths)
+        self.avgdl = sum(self.doc_lengths) / n if n else 0.0
+        self.idf = {
+            term: math.log(1.0 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+        avgdl = self.avgdl or 1.0
+        self._norms = [self.k1 * (1 - self.b + self.b * dl / avgdl) for dl in self.doc_lengths]
+
+    def _accumulate(self, query: str) -> Dict[int, float]:
+        """Term-at-a-time scoring over the postings of the query terms only"""
+        scores: Dict[int, float] = defaultdict(float)
+        k1_plus_1 = self.k1 + 1
+        norms = self._norms
+        for term, qtf in Counter(self.tokenizer(query)).items():
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            weight = self.idf[term] * qtf
+            for doc, tf in plist:
+                scores[doc] += weight * tf * k1_plus_1 / (tf + norms[doc])
+        return scores
+
+    def search(self, query: str, top_k: int = 20) -> List[Tuple[object, float]]:
+        """Return [(doc_id, score), ...] best first; only matching docs are scored"""
+        scores = self._accumulate(query)
+        top = heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])
+        return [(self.doc_ids[doc], score) for doc, score in top]
+
+    def get_scores(self, query: str) -> List[float]:
+        """Dense score list aligned with doc order (zeros for non-matching docs)"""
+        dense = [0.0] * len(self.doc_ids)
+        for doc, score in self._accumulate(query).items():
+            dense[doc] = score
+        return dense
+
+    # ===========================
+    # Persistence
+    # ===========================
+
+    def save(self, path: str, fingerprint: str = None) -> None:
+        """Write the index as JSON (atomic rename)"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        payload = {
+            "version": INDEX_FORMAT_VERSION,
+            "tokenizer": getattr(self.tokenizer, "__name__", str(self.tokenizer)),
+            "fingerprint": fingerprint,
+            "k1": self.k1,
+            "b": self.b,
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self.doc_lengths,
+            "postings": {term: [d for pair in plist for d in pair] for term, plist in self.postings.items()},
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, tokenizer: Callable[[str], List[str]] = simple_tokenize,
+             fingerprint: str = None) -> Optional["BM25Index"]:
+        """Load a saved index; None if missing, stale or built with another tokenizer"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != INDEX_FORMAT_VERSION:
+            return None
+        if fingerprint is not None and payload.get("fingerprint") != fingerprint:
+            return None
+        if payload.get("tokenizer") != getattr(tokenizer, "__name__", str(tokenizer)):
+            return None
+
+        index = cls(tokenizer, payload["k1"], payload["b"])
+        index.doc_ids = payload["doc_ids"]
+        index.doc_lengths = payload["doc_lengths"]
+        index.postings = {
+            term: list(zip(flat[0::2], flat[1::2])) for term, flat in payload["postings"].items()
+        }
+        index._finalize()
+        return index
+
+    @classmethod
+    def load_or_build(cls, path: str, texts: List[str], doc_ids: Optional[list] = None,
+                      tokenizer: Callable[[str], List[str]] = simple_tokenize,
+                      fingerprint: str = None, token_cache=None) -> "BM25Index":
+        """
+        Load from disk when the fingerprint matches, otherwise build and save.
+        With a token_cache (korean_tokenizer.TokenCache) only new texts are tokenized.
+        """
+        index = cls.load(path, tokenizer, fingerprint)
+        if index is not None:
+            return index
+        if token_cache is not None:
+            index = cls.from_tokens(token_cache.tokenize_many(texts), doc_ids, tokenizer)
+        else:
+            index = cls.build(texts, doc_ids, tokenizer)
+        index.save(path, fingerprint)
+        return index
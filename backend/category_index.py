@@ -0,0 +1,115 @@
+"""
+Category-partitioned vector index for Search-Roca
+Next to a shared EmbeddingIndex (used for unfiltered queries) it keeps one
+copy of the rows sorted by (category_major, category_middle): every major
+category is one contiguous block and every middle category a contiguous
+sub-range inside its major's block. A filtered query scores a slice (a view,
+no copy); when the slice has too few rows the query falls back to the whole
+catalog. The sorted copy is rebuilt once per build/refresh.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_index import EmbeddingIndex, top_k_indices
+
+GLOBAL_SCOPE = "global"
+
+
+class CategoryPartitionedIndex:
+    """
+    Same add/search interface as EmbeddingIndex plus category filters.
+    `min_candidates` is the smallest partition worth searching on its own
+    (default: top_k), below that the global index is used instead.
+    """
+
+    def __init__(self, min_candidates: Optional[int] = None, base: Optional[EmbeddingIndex] = None):
+        self.min_candidates = min_candidates
+        # Shared with the caller's text index: unfiltered queries score it directly
+        self.base = base if base is not None else EmbeddingIndex()
+        self._categories: Dict[int, Tuple[str, str]] = {}
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self._major_ranges: Dict[str, Tuple[int, int]] = {}
+        # major -> middle -> range, nested inside the major's block
+        self._middle_ranges: Dict[str, Dict[str, Tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    def add(self, ids, vectors, majors, middles=None) -> None:
+        """Insert/overwrite rows in the base index with their categories, then rebuild"""
+        self.base.add(ids, vectors)
+        self.assign(ids, majors, middles)
+        self.rebuild()
+
+    def assign(self, ids, majors, middles=None) -> None:
+        """Record categories for rows already in the base index (call rebuild() afterwards)"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        middles = middles if middles is not None else [None] * len(ids)
+        for pid, major, middle in zip(ids.tolist(), majors, middles):
+            self._categories[pid] = (major or "", middle or "")
+
+    def rebuild(self) -> None:
+        """Re-sort the base rows into category blocks (once per build/refresh)"""
+        keys = [self._categories.get(pid, ("", "")) for pid in self.base.ids.tolist()]
+        groups = sorted(set(keys))
+        codes = {key: code for code, key in enumerate(groups)}
+        labels = np.fromiter((codes[key] for key in keys), dtype=np.int64, count=len(keys))
+        order = np.argsort(labels, kind='stable')
+        self.ids = self.base.ids[order]
+        self.matrix = np.ascontiguousarray(self.base.matrix[order])
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(groups)))])
+
+        self._major_ranges.clear()
+        self._middle_ranges.clear()
+        for code, (major, middle) in enumerate(groups):
+            start, end = int(offsets[code]), int(offsets[code + 1])
+            self._middle_ranges.setdefault(major, {})[middle] = (start, end)
+            # Groups are sorted, so a major's middles are adjacent
+            self._major_ranges[major] = (self._major_ranges.get(major, (start, end))[0], end)
+
+    def categories(self) -> Dict[str, Dict[str, int]]:
+        """{major: {middle: row count}}"""
+        return {major: {middle: end - start for middle, (start, end) in middles.items()}
+                for major, middles in self._middle_ranges.items()}
+
+    def partition(self, major: str = None, middle: str = None) -> List[Tuple[int, int]]:
+        """Row ranges of the sorted matrix covered by a filter ([] if the category is unknown)"""
+        if middle is not None:
+            if major is not None:
+                block = self._middle_ranges.get(major, {}).get(middle)
+                return [block] if block else []
+            # Same middle name may exist under several majors
+            return [middles[middle] for middles in self._middle_ranges.values() if middle in middles]
+        if major is not None:
+            block = self._major_ranges.get(major)
+            return [block] if block else []
+        return [(0, len(self.ids))]
+
+    def search(self, query: np.ndarray, top_k: int = 5, major: str = None, middle: str = None,
+               min_candidates: int = None) -> List[Tuple[int, float]]:
+        return self.search_scoped(query, top_k, major, middle, min_candidates)[0]
+
+    def search_scoped(self, query: np.ndarray, top_k: int = 5, major: str = None, middle: str = None,
+                      min_candidates: int = None) -> Tuple[List[Tuple[int, float]], str]:
+        """Return ([(id, score)], scope) where scope is "middle", "major" or "global" """
+        if len(self) == 0:
+            return [], GLOBAL_SCOPE
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if major is not None or middle is not None:
+            filtered = self.partition(major, middle)
+            needed = min_candidates or self.min_candidates or top_k
+            if sum(end - start for start, end in filtered) >= needed:
+                # Slices of the sorted matrix are views: nothing is copied per query
+                if len(filtered) == 1:
+                    start, end = filtered[0]
+                    ids = self.ids[start:end]
+                    scores = self.matrix[start:end] @ query
+                else:
+                    ids = np.concatenate([self.ids[s:e] for s, e in filtered])
+                    scores = np.concatenate([self.matrix[s:e] @ query for s, e in filtered])
+                top = top_k_indices(scores, top_k)
+                scope = "middle" if middle is not None else "major"
+                return [(int(ids[i]), float(scores[i])) for i in top], scope
+        return self.base.search(query, top_k), GLOBAL_SCOPE
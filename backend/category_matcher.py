@@ -1,10 +1,22 @@
 """
 Category Matcher - Match products to Daiso categories
-Based on keyword matching from product names
+Based on keyword matching from product names: all CATEGORIES keywords are
+compiled into one Aho-Corasick automaton, so a name is scanned once no
+matter how many keywords there are.
+Products no keyword matches are then assigned by embedding similarity to
+per-category centroids (classify_unmatched), with the confidence stored in
+category_confidence.
 """
 import sqlite3
 import os
 import re
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from korean_tokenizer import compact
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'products.db')
 
@@ -84,6 +96,114 @@ CATEGORIES = {
     },
 }
 
+UNMATCHED = ("기타", "미분류")
+
+# Centroid classifier: softmax over centroid similarities at CLIP's logit
+# scale (1/0.01); raw cosines of CLIP text vectors are all ~0.6-0.99
+CLASSIFIER_TEMPERATURE = 0.01
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CATEGORY_CLASSIFIER_MIN_CONFIDENCE", "0.3"))
+CLASSIFIER_BATCH_SIZE = 64
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton: every keyword occurrence found in one pass over the text"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[tuple]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, value) -> None:
+        """Register `pattern`; matches report (pattern, value)"""
+        if not pattern:
+            return
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((pattern, value))
+        self._built = False
+
+    def build(self) -> "KeywordAutomaton":
+        """Compute failure links (BFS) and merge outputs along them"""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def find_all(self, text: str) -> List[Tuple[int, str, object]]:
+        """[(end index, pattern, value), ...] for every (overlapping) occurrence"""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        state, hits = 0, []
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits.extend((i, pattern, value) for pattern, value in out[state])
+        return hits
+
+
+def _build_automaton() -> KeywordAutomaton:
+    automaton = KeywordAutomaton()
+    order = 0
+    for major, middles in CATEGORIES.items():
+        for middle, keywords in middles.items():
+            for keyword in keywords:
+                # Value carries the category order for deterministic tie-breaks
+                automaton.add(compact(keyword), (major, middle, order))
+            order += 1
+    return automaton.build()
+
+_AUTOMATON = _build_automaton()
+
+def find_category_hits(text: str) -> Dict[Tuple[str, str], List[str]]:
+    """{(major, middle): [distinct matched keywords]} over the compacted text"""
+    hits: Dict[Tuple[str, str], List[str]] = {}
+    for _, keyword, (major, middle, _) in _AUTOMATON.find_all(compact(text)):
+        found = hits.setdefault((major, middle), [])
+        if keyword not in found:
+            found.append(keyword)
+    return hits
+
+def best_category_match(text: str) -> Optional[Tuple[str, str, str]]:
+    """
+    (keyword, major, middle) of the most specific match, else None.
+    Longest keyword wins ("압축팩" over "팩"); ties go to the category with
+    more distinct keyword hits, then to CATEGORIES order.
+    """
+    # (major, middle) -> [longest keyword, distinct keywords, order]
+    candidates = {}
+    for _, keyword, (major, middle, order) in _AUTOMATON.find_all(compact(text)):
+        entry = candidates.setdefault((major, middle), [keyword, set(), order])
+        if len(keyword) > len(entry[0]):
+            entry[0] = keyword
+        entry[1].add(keyword)
+    if not candidates:
+        return None
+    (major, middle), (keyword, _, _) = max(
+        candidates.items(), key=lambda kv: (len(kv[1][0]), len(kv[1][1]), -kv[1][2]))
+    return keyword, major, middle
+
 def get_connection():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
@@ -113,6 +233,11 @@ def init_category_tables():
         cursor.execute('ALTER TABLE products ADD COLUMN category_middle TEXT')
     except:
         pass
+    # 1.0 for keyword matches, softmax confidence for classifier assignments
+    try:
+        cursor.execute('ALTER TABLE products ADD COLUMN category_confidence REAL')
+    except:
+        pass
     
     conn.commit()
     conn.close()
@@ -137,15 +262,11 @@ def populate_categories():
 
 def match_product_to_category(product_name: str) -> tuple:
     """Match product name to category using keywords"""
-    product_lower = product_name.lower()
-    
-    for major, middles in CATEGORIES.items():
-        for middle, keywords in middles.items():
-            for keyword in keywords:
-                if keyword in product_lower:
-                    return (major, middle)
-    
-    return ("기타", "미분류")
+    # Normalized + spaces removed, so "욕실 매트" matches the keyword "욕실매트"
+    match = best_category_match(product_name)
+    if match is None:
+        return UNMATCHED
+    return (match[1], match[2])
 
 def update_all_products():
     """Match all products to categories"""
@@ -156,32 +277,141 @@ def update_all_products():
     products = cursor.fetchall()
     
     print(f"Matching {len(products)} products to categories...")
+    start = time.time()
     
-    matched = 0
-    unmatched = 0
-    
+    updates = []
     for product in products:
-        product_id = product['id']
-        name = product['name']
-        
-        major, middle = match_product_to_category(name)
-        
-        cursor.execute('''
-            UPDATE products SET category_major = ?, category_middle = ? WHERE id = ?
-        ''', (major, middle, product_id))
-        
-        if major != "기타":
-            matched += 1
-        else:
-            unmatched += 1
+        major, middle = match_product_to_category(product['name'])
+        confidence = None if (major, middle) == UNMATCHED else 1.0
+        updates.append((major, middle, confidence, product['id']))
+    matched = sum(1 for major, _, _, _ in updates if major != UNMATCHED[0])
+    unmatched = len(updates) - matched
+    
+    # One statement, one transaction for the whole catalog
+    cursor.executemany('''
+        UPDATE products SET category_major = ?, category_middle = ?, category_confidence = ? WHERE id = ?
+    ''', updates)
     
     conn.commit()
     conn.close()
     
-    print(f"\nResults:")
+    print(f"\nResults ({time.time() - start:.2f}s):")
     print(f"   Matched: {matched}")
     print(f"   Unmatched: {unmatched}")
 
+def build_centroids(keyword_vectors: Dict[Tuple[str, str], np.ndarray],
+                    product_vectors: np.ndarray, product_labels: List[Tuple[str, str]]):
+    """
+    One normalized centroid per (major, middle): the mean keyword vector and
+    the mean vector of products already matched to it, weighted equally.
+    Returns (labels, (K, dim) float32 matrix).
+    """
+    labels = list(keyword_vectors)
+    label_index = {label: i for i, label in enumerate(labels)}
+    dim = next(iter(keyword_vectors.values())).shape[1]
+    centroids = np.stack([vectors.mean(axis=0) for vectors in keyword_vectors.values()]).astype(np.float32)
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+    if len(product_labels):
+        # Per-category sums of product vectors in one scatter-add
+        rows = np.array([label_index.get(label, -1) for label in product_labels])
+        known = rows >= 0
+        sums = np.zeros((len(labels), dim), dtype=np.float32)
+        np.add.at(sums, rows[known], np.asarray(product_vectors, dtype=np.float32)[known])
+        counts = np.bincount(rows[known], minlength=len(labels)).astype(np.float32)
+        has_products = counts > 0
+        means = sums[has_products] / counts[has_products, None]
+        means /= np.maximum(np.linalg.norm(means, axis=1, keepdims=True), 1e-12)
+        centroids[has_products] += means
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return labels, centroids
+
+def classify_by_centroid(vectors: np.ndarray, centroids: np.ndarray,
+                         temperature: float = CLASSIFIER_TEMPERATURE):
+    """(best centroid index, softmax confidence) per row, one matrix product for all rows"""
+    scores = np.asarray(vectors, dtype=np.float32) @ centroids.T
+    logits = (scores - scores.max(axis=1, keepdims=True)) / temperature
+    probs = np.exp(logits)
+    probs /= probs.sum(axis=1, keepdims=True)
+    best = np.argmax(scores, axis=1)
+    return best, probs[np.arange(len(best)), best]
+
+def classify_unmatched(min_confidence: float = CLASSIFIER_MIN_CONFIDENCE) -> int:
+    """
+    Assign unmatched products to the nearest category centroid. Uses the
+    stored CLIP text embeddings; only keyword texts (and products without
+    an embedding) are encoded, in batches. Returns the number assigned.
+    """
+    # Lazy import: CLIP/torch are only needed for this stage
+    import embeddings
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT p.id, p.name, p.category_major, p.category_middle, pe.text_embedding
+        FROM products p
+        LEFT JOIN product_embeddings pe ON p.id = pe.product_id
+             AND pe.embedding_version = ? AND pe.embedding_model = ?
+    ''', (embeddings.EMBEDDING_FORMAT_VERSION, embeddings.MODEL_NAME))
+    rows = cursor.fetchall()
+    
+    unmatched = [row for row in rows if (row['category_major'], row['category_middle']) == UNMATCHED
+                 or row['category_major'] is None]
+    if not unmatched:
+        conn.close()
+        print("No unmatched products to classify")
+        return 0
+    
+    def encode(texts):
+        texts = list(texts)
+        return np.vstack([embeddings.get_text_embeddings_batch(texts[i:i + CLASSIFIER_BATCH_SIZE])
+                          for i in range(0, len(texts), CLASSIFIER_BATCH_SIZE)])
+    
+    def vectors_for(products):
+        """Stored embeddings, encoding only the products that have none"""
+        missing = [i for i, row in enumerate(products) if row['text_embedding'] is None]
+        encoded = dict(zip(missing, encode(products[i]['name'] for i in missing))) if missing else {}
+        return np.stack([encoded[i] if i in encoded else embeddings.decode_embedding(row['text_embedding'])
+                         for i, row in enumerate(products)])
+    
+    start = time.time()
+    # Keyword prior: every keyword of every category in shared batches
+    keyword_texts, keyword_labels = [], []
+    for major, middles in CATEGORIES.items():
+        for middle, keywords in middles.items():
+            keyword_texts.extend(keywords)
+            keyword_labels.extend([(major, middle)] * len(keywords))
+    keyword_matrix = encode(keyword_texts)
+    positions = {}
+    for i, label in enumerate(keyword_labels):
+        positions.setdefault(label, []).append(i)
+    keyword_vectors = {label: keyword_matrix[idx] for label, idx in positions.items()}
+    
+    matched = [row for row in rows if row['text_embedding'] is not None
+               and row['category_major'] is not None
+               and (row['category_major'], row['category_middle']) != UNMATCHED]
+    labels, centroids = build_centroids(
+        keyword_vectors,
+        embeddings.decode_embeddings(row['text_embedding'] for row in matched),
+        [(row['category_major'], row['category_middle']) for row in matched],
+    )
+    
+    best, confidence = classify_by_centroid(vectors_for(unmatched), centroids)
+    updates = []
+    for row, idx, score in zip(unmatched, best.tolist(), confidence.tolist()):
+        if score >= min_confidence:
+            major, middle = labels[idx]
+            updates.append((major, middle, round(score, 4), row['id']))
+    cursor.executemany('''
+        UPDATE products SET category_major = ?, category_middle = ?, category_confidence = ? WHERE id = ?
+    ''', updates)
+    conn.commit()
+    conn.close()
+    
+    print(f"\nCentroid classifier ({time.time() - start:.2f}s, {len(labels)} centroids):")
+    print(f"   Assigned: {len(updates)} / {len(unmatched)} unmatched (min confidence {min_confidence})")
+    return len(updates)
+
 def show_category_stats():
     """Show category distribution"""
     conn = get_connection()
@@ -224,5 +454,6 @@ if __name__ == "__main__":
     init_category_tables()
     populate_categories()
     update_all_products()
+    classify_unmatched()
     show_category_stats()
     show_unmatched()
@@ -17,7 +17,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 
-from database import init_database, insert_product, get_product_count, product_exists
+from database import init_database, get_product_count, get_existing_product_names, insert_products_bulk, INSERTED
 
 # Constants
 TARGET_URL = "https://www.daisomall.co.kr/ds/rank/C105"
@@ -170,10 +170,13 @@ def crawl_products():
             
             print(f"\n   📋 Extracted {len(products_data)} products via JS")
             
+            # One lookup for the whole page instead of product_exists() per item
+            existing = get_existing_product_names(p.get('name', '').strip() for p in products_data)
+            new_products = []
             for p in products_data:
                 try:
                     name = p.get('name', '').strip()
-                    if not name or product_exists(name):
+                    if not name or name in existing:
                         continue
                     
                     rank = int(p.get('rank', 0)) if p.get('rank', '').isdigit() else 0
@@ -188,12 +191,18 @@ def crawl_products():
                     image_name = f"{rank:03d}_{safe_name}.jpg" if safe_name else f"{rank:03d}_product.jpg"
                     image_path = download_image(image_url, image_name) if image_url else None
                     
-                    if insert_product(rank, name, price, image_url, image_name, image_path):
-                        print(f"   ✅ [{rank}] {name[:35]}... ({price}원)")
+                    new_products.append({"rank": rank, "name": name, "price": price, "image_url": image_url,
+                                         "image_name": image_name, "image_path": image_path})
+                    existing.add(name)
                     
                 except Exception as e:
                     continue
             
+            # Whole page in one transaction
+            for product, outcome in zip(new_products, insert_products_bulk(new_products)):
+                if outcome == INSERTED:
+                    print(f"   ✅ [{product['rank']}] {product['name'][:35]}... ({product['price']}원)")
+            
         except Exception as e:
             print(f"❌ Error: {e}")
             random_delay(10, 30)
@@ -1,20 +1,140 @@
 """
 Database module for Search-Roca
 SQLite for now, PostgreSQL ready for later
+
+Helpers share one connection per thread (see connection()/transaction())
+instead of connecting per call; every connection gets the PRAGMAS below
+(tunable via DB_* env vars). WAL is opt-in (DB_WAL=1); close_pool() at
+shutdown checkpoints it and closes every pooled connection.
 """
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from itertools import islice
+from typing import Iterable, List, Dict, Optional, Set, Tuple
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'products.db')
 
-def get_connection():
-    """Get SQLite connection"""
-    conn = sqlite3.connect(DB_PATH)
+PRAGMAS = {
+    "cache_size": -int(os.getenv("DB_CACHE_SIZE_KB", "65536")),   # negative = KiB
+    "mmap_size": int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+    "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+}
+
+# WAL lets readers run alongside a writer; with WAL, synchronous=NORMAL only
+# fsyncs at checkpoints instead of on every commit. Opt-in: it rewrites the
+# file header and adds -wal/-shm files, and products.db is tracked in git.
+DB_WAL = os.getenv("DB_WAL", "0") == "1"
+if DB_WAL:
+    PRAGMAS.update(journal_mode="WAL", synchronous=os.getenv("DB_SYNCHRONOUS", "NORMAL"))
+
+# Bulk inserts: rows per executemany call (all chunks share one transaction)
+BULK_CHUNK_SIZE = int(os.getenv("DB_BULK_CHUNK_SIZE", "5000"))
+# Stay under SQLITE_MAX_VARIABLE_NUMBER of older SQLite builds
+_MAX_SQL_VARIABLES = 900
+
+# Per-row outcomes of the bulk APIs
+INSERTED = "inserted"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+
+PRODUCT_FIELDS = ('rank', 'name', 'price', 'image_url', 'image_name', 'image_path')
+
+# FTS5 trigram index over product names: substring matching that works for
+# Korean without a morphological tokenizer, but needs >= 3 characters per term
+FTS_MIN_TERM_CHARS = 3
+# Secondary indexes for filtered product queries (created if the column exists)
+PRODUCT_INDEX_COLUMNS = ('category_major', 'category_middle', 'price', 'rank')
+UTTERANCE_DIFFICULTIES = ('normal', 'hard')
+
+_local = threading.local()
+_search_index_ready = set()
+# Every thread's pooled (path, connection), so close_pool() can reach them all
+_pool_lock = threading.Lock()
+_pooled: List[Tuple[str, sqlite3.Connection]] = []
+_pool_generation = 0
+
+def _connect(path: str, **kwargs) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=PRAGMAS["busy_timeout"] / 1000.0, **kwargs)
     conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+def get_connection():
+    """Get a new SQLite connection (caller closes it); prefer connection()/transaction()"""
+    return _connect(DB_PATH)
+
+def _pooled_connection() -> sqlite3.Connection:
+    """This thread's reusable connection to DB_PATH (opened on first use)"""
+    pool = getattr(_local, 'connections', None)
+    if pool is None or getattr(_local, 'generation', None) != _pool_generation:
+        # First use, or close_pool() closed this thread's connections
+        pool = _local.connections = {}
+        _local.generation = _pool_generation
+    conn = pool.get(DB_PATH)
+    if conn is None:
+        # Only ever used by this thread; check_same_thread is off so close_pool() can close it
+        conn = pool[DB_PATH] = _connect(DB_PATH, check_same_thread=False)
+        with _pool_lock:
+            _pooled.append((DB_PATH, conn))
     return conn
 
+@contextmanager
+def connection():
+    """Borrow this thread's pooled connection for reads (left open on exit)"""
+    yield _pooled_connection()
+
+@contextmanager
+def transaction():
+    """
+    Commit on success, roll back on error, on this thread's pooled
+    connection. Nested blocks join the outermost transaction.
+    """
+    conn = _pooled_connection()
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    try:
+        yield conn
+        if depth == 0:
+            conn.commit()
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+        raise
+    finally:
+        _local.depth = depth
+
+def close_connections():
+    """Close this thread's pooled connections (e.g. at worker/script exit)"""
+    closing = list(getattr(_local, 'connections', {}).values())
+    with _pool_lock:
+        _pooled[:] = [(path, conn) for path, conn in _pooled if conn not in closing]
+    for conn in closing:
+        conn.close()
+    _local.connections = {}
+
+def close_pool():
+    """
+    Close every thread's pooled connection (app shutdown, once workers are
+    idle); with WAL, checkpoint the log back into the main file first.
+    """
+    global _pool_generation
+    with _pool_lock:
+        closing = list(_pooled)
+        _pooled.clear()
+        _pool_generation += 1
+    for _, conn in closing:
+        conn.close()
+    if DB_WAL:
+        for path in sorted({path for path, _ in closing}):
+            conn = _connect(path)
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.close()
+
 def init_database():
     """Initialize database tables"""
     conn = get_connection()
@@ -48,91 +168,280 @@ def init_database():
     ''')
     
     # Product embeddings table (for CLIP)
+    # Embeddings are raw little-endian float32 bytes described by the side columns
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS product_embeddings (
             product_id INTEGER PRIMARY KEY,
             text_embedding BLOB,
             image_embedding BLOB,
+            embedding_dim INTEGER,
+            embedding_model TEXT,
+            embedding_version INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (product_id) REFERENCES products(id)
         )
     ''')
+    _add_embedding_columns(cursor)
+    _add_utterance_index(cursor)
+    _add_search_index(cursor)
     
     conn.commit()
     conn.close()
     print(f"✅ Database initialized: {DB_PATH}")
 
+def _add_embedding_columns(cursor):
+    """Add embedding format columns to tables created before they existed"""
+    cursor.execute('PRAGMA table_info(product_embeddings)')
+    existing = {row[1] for row in cursor.fetchall()}
+    for column, col_type in (('embedding_dim', 'INTEGER'),
+                             ('embedding_model', 'TEXT'),
+                             ('embedding_version', 'INTEGER')):
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE product_embeddings ADD COLUMN {column} {col_type}')
+
+def _add_utterance_index(cursor):
+    """Duplicate checks of insert_utterances_bulk look utterances up by text"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_test_utterances_utterance ON test_utterances(utterance)')
+
+def _add_search_index(cursor):
+    """products_fts (external-content FTS5 kept in sync by triggers) plus column indexes"""
+    cursor.execute('PRAGMA table_info(products)')
+    columns = {row[1] for row in cursor.fetchall()}
+    for column in PRODUCT_INDEX_COLUMNS:
+        if column in columns:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_products_{column} ON products({column})')
+    
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+    if cursor.fetchone() is not None:
+        return
+    cursor.execute('''
+        CREATE VIRTUAL TABLE products_fts USING fts5(
+            name, content='products', content_rowid='id', tokenize='trigram'
+        )
+    ''')
+    cursor.executescript('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+        END;
+    ''')
+    # Index the rows that existed before the table
+    cursor.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+def ensure_search_index():
+    """Create the FTS table/triggers and column indexes on an existing database (idempotent)"""
+    if DB_PATH in _search_index_ready:
+        return
+    with transaction() as conn:
+        _add_search_index(conn.cursor())
+    _search_index_ready.add(DB_PATH)
+
+def ensure_embedding_columns():
+    """Make sure product_embeddings has the format columns"""
+    with transaction() as conn:
+        _add_embedding_columns(conn.cursor())
+
 def insert_product(rank: int, name: str, price: int, image_url: str, 
                    image_name: str = None, image_path: str = None) -> bool:
     """Insert product, skip if duplicate"""
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            INSERT OR IGNORE INTO products (rank, name, price, image_url, image_name, image_path)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (rank, name, price, image_url, image_name, image_path))
-        conn.commit()
-        inserted = cursor.rowcount > 0
+        with transaction() as conn:
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO products (rank, name, price, image_url, image_name, image_path)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (rank, name, price, image_url, image_name, image_path))
+            inserted = cursor.rowcount > 0
         return inserted
     except Exception as e:
         print(f"❌ Insert error: {e}")
         return False
-    finally:
-        conn.close()
+
+def _chunks(rows: Iterable, size: int):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _begin_immediate(conn: sqlite3.Connection) -> None:
+    """Take the write lock up front so duplicate checks can't race another writer"""
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+def _existing_names(conn: sqlite3.Connection, names: List[str]) -> Set[str]:
+    existing = set()
+    for start in range(0, len(names), _MAX_SQL_VARIABLES):
+        part = names[start:start + _MAX_SQL_VARIABLES]
+        placeholders = ','.join('?' * len(part))
+        existing.update(row[0] for row in conn.execute(
+            f'SELECT name FROM products WHERE name IN ({placeholders})', part))
+    return existing
+
+def get_existing_product_names(names: Iterable[str]) -> Set[str]:
+    """Which of `names` are already stored (one query per 900 names)"""
+    with connection() as conn:
+        return _existing_names(conn, list(dict.fromkeys(names)))
+
+def insert_products_bulk(products: Iterable[Dict], chunk_size: int = BULK_CHUNK_SIZE) -> List[str]:
+    """
+    Insert many products (dicts with PRODUCT_FIELDS keys) in one transaction,
+    one executemany per chunk. Returns one outcome per row: INSERTED,
+    DUPLICATE (name already stored or earlier in the batch) or INVALID (no name).
+    """
+    outcomes = []
+    seen = set()
+    with transaction() as conn:
+        _begin_immediate(conn)
+        for chunk in _chunks(products, chunk_size):
+            names = [(p.get('name') or '').strip() for p in chunk]
+            existing = _existing_names(conn, [n for n in dict.fromkeys(names) if n])
+            rows = []
+            for product, name in zip(chunk, names):
+                if not name:
+                    outcomes.append(INVALID)
+                elif name in existing or name in seen:
+                    outcomes.append(DUPLICATE)
+                else:
+                    seen.add(name)
+                    rows.append(tuple(name if f == 'name' else product.get(f) for f in PRODUCT_FIELDS))
+                    outcomes.append(INSERTED)
+            conn.executemany(f'''
+                INSERT OR IGNORE INTO products ({', '.join(PRODUCT_FIELDS)})
+                VALUES ({', '.join('?' * len(PRODUCT_FIELDS))})
+            ''', rows)
+    return outcomes
+
+def search_products_fts(query: str, limit: int = 20, category_major: str = None,
+                        category_middle: str = None, max_price: int = None) -> List[Dict]:
+    """
+    Product name search ranked by bm25 over the trigram FTS index; every
+    term must appear in the name. Terms shorter than 3 characters can't
+    use trigrams and become LIKE filters (a query of only short terms falls
+    back to LIKE ordered by rank). Rows carry "score" (higher is better).
+    """
+    ensure_search_index()
+    terms = query.split()
+    long_terms = [t for t in terms if len(t) >= FTS_MIN_TERM_CHARS]
+    short_terms = [t for t in terms if len(t) < FTS_MIN_TERM_CHARS]
+    if not terms:
+        return []
+    
+    filters, params = [], []
+    for term in short_terms:
+        filters.append("p.name LIKE ?")
+        params.append(f"%{term}%")
+    for column, value in (('category_major', category_major), ('category_middle', category_middle)):
+        if value is not None:
+            filters.append(f"p.{column} = ?")
+            params.append(value)
+    if max_price is not None:
+        filters.append("p.price <= ?")
+        params.append(max_price)
+    
+    with connection() as conn:
+        if long_terms:
+            # Quoted phrases: user text can't inject FTS5 query syntax
+            match = ' '.join('"' + t.replace('"', '""') + '"' for t in long_terms)
+            where = ' AND '.join(["products_fts MATCH ?"] + filters)
+            rows = conn.execute(f'''
+                SELECT p.*, -bm25(products_fts) AS score
+                FROM products_fts JOIN products p ON p.id = products_fts.rowid
+                WHERE {where}
+                ORDER BY bm25(products_fts)
+                LIMIT ?
+            ''', [match] + params + [limit]).fetchall()
+        else:
+            rows = conn.execute(f'''
+                SELECT p.*, NULL AS score
+                FROM products p
+                WHERE {' AND '.join(filters)}
+                ORDER BY p.rank
+                LIMIT ?
+            ''', params + [limit]).fetchall()
+    return [dict(row) for row in rows]
 
 def get_product_count() -> int:
     """Get total number of products"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM products')
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
 
 def get_all_products() -> List[Dict]:
     """Get all products"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM products ORDER BY rank')
-    rows = cursor.fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute('SELECT * FROM products ORDER BY rank').fetchall()
     return [dict(row) for row in rows]
 
 def product_exists(name: str) -> bool:
     """Check if product already exists"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT 1 FROM products WHERE name = ?', (name,))
-    exists = cursor.fetchone() is not None
-    conn.close()
-    return exists
+    with connection() as conn:
+        return conn.execute('SELECT 1 FROM products WHERE name = ?', (name,)).fetchone() is not None
 
 def insert_utterance(utterance: str, difficulty: str, product_id: int) -> bool:
     """Insert test utterance"""
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            INSERT INTO test_utterances (utterance, difficulty, expected_product_id)
-            VALUES (?, ?, ?)
-        ''', (utterance, difficulty, product_id))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute('''
+                INSERT INTO test_utterances (utterance, difficulty, expected_product_id)
+                VALUES (?, ?, ?)
+            ''', (utterance, difficulty, product_id))
         return True
     except Exception as e:
         print(f"❌ Insert utterance error: {e}")
         return False
-    finally:
-        conn.close()
+
+def _existing_utterances(conn: sqlite3.Connection, keys: List[Tuple[str, int]]) -> Set[Tuple[str, int]]:
+    texts = list(dict.fromkeys(text for text, _ in keys))
+    existing = set()
+    for start in range(0, len(texts), _MAX_SQL_VARIABLES):
+        part = texts[start:start + _MAX_SQL_VARIABLES]
+        placeholders = ','.join('?' * len(part))
+        existing.update((row[0], row[1]) for row in conn.execute(
+            f'SELECT utterance, expected_product_id FROM test_utterances WHERE utterance IN ({placeholders})', part))
+    return existing
+
+def insert_utterances_bulk(utterances: Iterable[Tuple[str, str, int]],
+                           chunk_size: int = BULK_CHUNK_SIZE) -> List[str]:
+    """
+    Insert many (utterance, difficulty, product_id) rows in one transaction,
+    one executemany per chunk. Returns one outcome per row: INSERTED,
+    DUPLICATE (same utterance for the same product already stored or earlier
+    in the batch) or INVALID (empty text or unknown difficulty).
+    """
+    outcomes = []
+    seen = set()
+    with transaction() as conn:
+        _begin_immediate(conn)
+        _add_utterance_index(conn.cursor())
+        for chunk in _chunks(utterances, chunk_size):
+            existing = _existing_utterances(conn, [(text, pid) for text, _, pid in chunk if text])
+            rows = []
+            for text, difficulty, product_id in chunk:
+                key = (text, product_id)
+                if not text or difficulty not in UTTERANCE_DIFFICULTIES:
+                    outcomes.append(INVALID)
+                elif key in existing or key in seen:
+                    outcomes.append(DUPLICATE)
+                else:
+                    seen.add(key)
+                    rows.append((text, difficulty, product_id))
+                    outcomes.append(INSERTED)
+            conn.executemany('''
+                INSERT INTO test_utterances (utterance, difficulty, expected_product_id)
+                VALUES (?, ?, ?)
+            ''', rows)
+    return outcomes
 
 def get_utterance_count() -> int:
     """Get total number of test utterances"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM test_utterances')
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM test_utterances').fetchone()[0]
 
 if __name__ == "__main__":
     init_database()
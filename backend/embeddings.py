@@ -2,30 +2,63 @@
 CLIP Embedding Generator for Search-Roca
 Creates text and image embeddings for multimodal search
 """
+import io
 import os
+import time
 import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
 import torch
 from transformers import CLIPProcessor, CLIPModel
 
-from database import get_connection, get_all_products
+from database import get_connection, get_all_products, ensure_embedding_columns
+from vector_index import EmbeddingIndex, MultimodalIndex
+from ann_index import create_index
+from category_index import CategoryPartitionedIndex
+from upload_limits import MAX_UPLOAD_BYTES, MAX_UPLOAD_PIXELS, InvalidUploadError
 
 # Model configuration
 MODEL_NAME = "openai/clip-vit-base-patch32"
 IMAGES_DIR = os.path.join(os.path.dirname(__file__), 'images')
 
+# Storage format: raw little-endian float32 bytes (version 1).
+# Rows written before versioning (pickled ndarrays) have embedding_version NULL.
+EMBEDDING_DTYPE = np.dtype('<f4')
+EMBEDDING_FORMAT_VERSION = 1
+
+# Multimodal search: fused score = (1 - w) * text + w * image
+IMAGE_WEIGHT = float(os.getenv("MULTIMODAL_IMAGE_WEIGHT", "0.3"))
+
+# Photo queries: image side weighted higher, uploads decoded within upload_limits bounds
+IMAGE_QUERY_WEIGHT = float(os.getenv("IMAGE_QUERY_WEIGHT", "0.7"))
+UPLOAD_MAX_SIDE = 448  # CLIP only sees 224x224; keep some headroom for its center crop
+
 # Global model cache
 _model = None
 _processor = None
+_model_lock = threading.Lock()
+
+# Global text index (built once, refreshed incrementally)
+_text_index = None
+_category_index = None
+_multimodal_index = None
+_product_info = {}
+# Reentrant: get_*_index() builds under the lock through build_text_index()
+_index_lock = threading.RLock()
 
 def load_model():
-    """Load CLIP model (cached)"""
+    """Load CLIP model (cached, loaded once even under concurrent first requests)"""
     global _model, _processor
     if _model is None:
-        print("🔄 Loading CLIP model...")
-        _model = CLIPModel.from_pretrained(MODEL_NAME)
-        _processor = CLIPProcessor.from_pretrained(MODEL_NAME)
-        print("✅ CLIP model loaded")
+        with _model_lock:
+            if _model is None:
+                print("🔄 Loading CLIP model...")
+                _processor = CLIPProcessor.from_pretrained(MODEL_NAME)
+                # Assigned last: the unlocked check above then sees a complete pair
+                _model = CLIPModel.from_pretrained(MODEL_NAME)
+                print("✅ CLIP model loaded")
     return _model, _processor
 
 def get_text_embedding(text: str) -> bytes:
@@ -40,7 +73,7 @@ def get_text_embedding(text: str) -> bytes:
     text_features = text_features / text_features.norm(dim=-1, keepdim=True)
     
     # Convert to bytes for storage
-    return pickle.dumps(text_features.numpy())
+    return encode_embedding(text_features.numpy())
 
 def get_image_embedding(image_path: str) -> bytes:
     """Get image embedding as bytes"""
@@ -59,96 +92,377 @@ def get_image_embedding(image_path: str) -> bytes:
         # Normalize
         image_features = image_features / image_features.norm(dim=-1, keepdim=True)
         
-        return pickle.dumps(image_features.numpy())
+        return encode_embedding(image_features.numpy())
     except Exception as e:
         print(f"⚠️ Image embedding failed for {image_path}: {e}")
         return None
 
-def generate_all_embeddings():
-    """Generate embeddings for all products"""
-    print("=" * 50)
-    print("🚀 Generating CLIP Embeddings")
-    print("=" * 50)
-    
-    products = get_all_products()
-    if not products:
-        print("❌ No products found. Run crawler first.")
-        return
+def encode_embedding(vector) -> bytes:
+    """Serialize an embedding as raw little-endian float32 bytes"""
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).reshape(-1).tobytes()
+
+def decode_embedding(blob: bytes) -> np.ndarray:
+    """Zero-copy view of a stored embedding BLOB"""
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
+
+def decode_embeddings(blobs) -> np.ndarray:
+    """Decode many same-sized BLOBs into one (N, dim) matrix with a single copy"""
+    blobs = list(blobs)
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+    flat = np.frombuffer(b''.join(blobs), dtype=EMBEDDING_DTYPE)
+    return flat.reshape(len(blobs), -1).astype(np.float32, copy=False)
+
+def migrate_embeddings() -> int:
+    """One-shot migration of pickled embedding rows to the raw float32 format"""
+    ensure_embedding_columns()
     
     conn = get_connection()
     cursor = conn.cursor()
+    cursor.execute('''
+        SELECT product_id, text_embedding, image_embedding
+        FROM product_embeddings
+        WHERE embedding_version IS NULL
+    ''')
+    rows = cursor.fetchall()
+    if not rows:
+        conn.close()
+        return 0
     
-    for i, product in enumerate(products):
-        product_id = product['id']
-        name = product['name']
-        image_path = product['image_path']
-        
-        # Check if already embedded
-        cursor.execute('SELECT 1 FROM product_embeddings WHERE product_id = ?', (product_id,))
-        if cursor.fetchone():
-            continue
-        
-        print(f"[{i+1}/{len(products)}] {name[:40]}...")
-        
-        # Generate embeddings
-        text_emb = get_text_embedding(name)
-        image_emb = get_image_embedding(image_path) if image_path else None
-        
-        # Insert
-        cursor.execute('''
-            INSERT OR REPLACE INTO product_embeddings (product_id, text_embedding, image_embedding)
-            VALUES (?, ?, ?)
-        ''', (product_id, text_emb, image_emb))
-        
-        if (i + 1) % 10 == 0:
-            conn.commit()
+    print(f"🔄 Migrating {len(rows)} pickled embeddings to raw float32...")
     
+    def convert(blob):
+        if blob is None:
+            return None
+        return encode_embedding(pickle.loads(blob))
+    
+    updates = []
+    for row in rows:
+        text_emb = convert(row['text_embedding'])
+        image_emb = convert(row['image_embedding'])
+        dim = len(text_emb or image_emb or b'') // EMBEDDING_DTYPE.itemsize or None
+        updates.append((text_emb, image_emb, dim, MODEL_NAME, EMBEDDING_FORMAT_VERSION, row['product_id']))
+    
+    cursor.executemany('''
+        UPDATE product_embeddings
+        SET text_embedding = ?, image_embedding = ?,
+            embedding_dim = ?, embedding_model = ?, embedding_version = ?
+        WHERE product_id = ?
+    ''', updates)
     conn.commit()
     conn.close()
     
-    print("\n" + "=" * 50)
-    print("✅ Embeddings generated!")
-    print("=" * 50)
+    print(f"✅ Migrated {len(updates)} embeddings")
+    return len(updates)
+
+def _load_text_rows(product_ids=None):
+    """Fetch (id, name, price, categories, text/image embedding) rows, optionally for given ids only"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    query = '''
+        SELECT p.id, p.name, p.price, p.category_major, p.category_middle,
+               pe.text_embedding, pe.image_embedding
+        FROM products p
+        JOIN product_embeddings pe ON p.id = pe.product_id
+        WHERE pe.text_embedding IS NOT NULL
+          AND pe.embedding_version = ? AND pe.embedding_model = ?
+    '''
+    params = [EMBEDDING_FORMAT_VERSION, MODEL_NAME]
+    if product_ids is None:
+        cursor.execute(query, params)
+    else:
+        placeholders = ','.join('?' * len(product_ids))
+        cursor.execute(query + f' AND p.id IN ({placeholders})', params + list(product_ids))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def _add_rows_to_index(index, category_index: CategoryPartitionedIndex,
+                       multimodal_index: MultimodalIndex, rows):
+    """Add rows to every index; the category/multimodal views are rebuilt once per call"""
+    if not rows:
+        return
+    ids = [row['id'] for row in rows]
+    vectors = decode_embeddings(row['text_embedding'] for row in rows)
+    index.add(ids, vectors)
+    if category_index.base is not index:
+        # ANN backend: the category/multimodal views share an exact matrix kept next to it
+        category_index.base.add(ids, vectors)
+    category_index.assign(ids,
+                          [row['category_major'] for row in rows],
+                          [row['category_middle'] for row in rows])
+    category_index.rebuild()
+    multimodal_index.set_images(ids, [decode_embedding(row['image_embedding']) if row['image_embedding'] else None
+                                      for row in rows])
+    multimodal_index.rebuild()
+    for row in rows:
+        _product_info[row['id']] = {
+            'name': row['name'], 'price': row['price'],
+            'category_major': row['category_major'], 'category_middle': row['category_middle'],
+        }
+
+def build_text_index():
+    """Load every text embedding into one contiguous matrix (call at startup)"""
+    global _text_index, _category_index, _multimodal_index
+    with _index_lock:
+        migrate_embeddings()
+        # Exact by default; ANN_BACKEND=ivf|hnsw selects an approximate index
+        index = create_index()
+        # Category view over the same matrix: a filtered query scores only its rows
+        base = index if isinstance(index, EmbeddingIndex) else EmbeddingIndex()
+        category_index = CategoryPartitionedIndex(base=base)
+        # Image matrix aligned to the same rows for fused multimodal scoring
+        multimodal_index = MultimodalIndex(IMAGE_WEIGHT, base=base)
+        _product_info.clear()
+        _add_rows_to_index(index, category_index, multimodal_index, _load_text_rows())
+        _text_index = index
+        _category_index = category_index
+        _multimodal_index = multimodal_index
+    print(f"✅ Text index loaded: {len(index)} vectors, {len(category_index.categories())} categories")
+    return index
+
+def _ensure_index():
+    """Build the indexes once, even if several requests arrive before startup finished"""
+    if _multimodal_index is None:
+        with _index_lock:
+            if _multimodal_index is None:
+                build_text_index()
+
+def get_text_index():
+    """Get text index (built on first use)"""
+    _ensure_index()
+    return _text_index
 
-def search_by_text(query: str, top_k: int = 5):
-    """Search products by text query using CLIP"""
+def get_category_index():
+    """Get category-partitioned view of the text index (built on first use)"""
+    _ensure_index()
+    return _category_index
+
+def get_multimodal_index():
+    """Get text+image index (built on first use)"""
+    _ensure_index()
+    return _multimodal_index
+
+def refresh_text_index(product_ids):
+    """Add/overwrite rows for newly embedded products in the loaded index"""
+    if _text_index is None or not product_ids:
+        return
+    product_ids = list(product_ids)
+    # Fetched in chunks (SQLite variable limit), indexed in one pass
+    rows = []
+    for start in range(0, len(product_ids), 500):
+        rows.extend(_load_text_rows(product_ids[start:start + 500]))
+    with _index_lock:
+        _add_rows_to_index(_text_index, _category_index, _multimodal_index, rows)
+
+def encode_text_query(query: str) -> np.ndarray:
+    """Encode a query into a normalized float32 vector"""
     model, processor = load_model()
     
-    # Get query embedding
     inputs = processor(text=[query], return_tensors="pt", padding=True, truncation=True)
     with torch.no_grad():
         query_features = model.get_text_features(**inputs)
     query_features = query_features / query_features.norm(dim=-1, keepdim=True)
+    return query_features[0].numpy().astype(np.float32)
+
+def decode_upload(data: bytes, max_side: int = UPLOAD_MAX_SIDE):
+    """
+    Decode an uploaded photo into a small RGB image.
+    Raises InvalidUploadError for oversized or undecodable uploads.
+    """
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise InvalidUploadError(f"Image larger than {MAX_UPLOAD_BYTES} bytes")
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Header only so far: reject decompression bombs before decoding pixels
+        if image.width * image.height > MAX_UPLOAD_PIXELS:
+            raise InvalidUploadError(f"Image larger than {MAX_UPLOAD_PIXELS} pixels")
+        # JPEG: let the decoder downscale (1/2..1/8) instead of decoding full size
+        image.draft('RGB', (max_side, max_side))
+        image = image.convert('RGB')
+    except InvalidUploadError:
+        raise
+    except Exception as e:
+        raise InvalidUploadError(f"Cannot decode image: {e}") from e
+    image.thumbnail((max_side, max_side))
+    return image
+
+def encode_image_query(image) -> np.ndarray:
+    """Encode a decoded image into a normalized float32 vector"""
+    model, processor = load_model()
     
-    # Load all embeddings and compare
-    conn = get_connection()
-    cursor = conn.cursor()
+    inputs = processor(images=image, return_tensors="pt")
+    with torch.no_grad():
+        image_features = model.get_image_features(**inputs)
+    image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+    return image_features[0].numpy().astype(np.float32)
+
+def get_text_embeddings_batch(texts) -> np.ndarray:
+    """Encode many texts in one model call, returns normalized (N, dim) float32"""
+    model, processor = load_model()
+    
+    inputs = processor(text=list(texts), return_tensors="pt", padding=True, truncation=True)
+    with torch.no_grad():
+        text_features = model.get_text_features(**inputs)
+    text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+    return text_features.numpy().astype(np.float32)
+
+def _load_image(image_path: str):
+    """Decode an image file to RGB (runs on the decode thread pool)"""
+    if not image_path or not os.path.exists(image_path):
+        return None
+    try:
+        return Image.open(image_path).convert('RGB')
+    except Exception as e:
+        print(f"⚠️ Image load failed for {image_path}: {e}")
+        return None
+
+def get_image_embeddings_batch(images) -> list:
+    """Encode decoded images in one model call; None entries stay None"""
+    model, processor = load_model()
+    
+    valid = [i for i, image in enumerate(images) if image is not None]
+    results = [None] * len(images)
+    if not valid:
+        return results
+    
+    inputs = processor(images=[images[i] for i in valid], return_tensors="pt")
+    with torch.no_grad():
+        image_features = model.get_image_features(**inputs)
+    image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+    
+    for row, i in zip(image_features.numpy(), valid):
+        results[i] = row
+    return results
+
+def _get_unembedded_products(cursor) -> list:
+    """All products without an embedding row, in one query"""
     cursor.execute('''
-        SELECT p.id, p.name, p.price, pe.text_embedding
+        SELECT p.id, p.name, p.image_path
         FROM products p
-        JOIN product_embeddings pe ON p.id = pe.product_id
-        WHERE pe.text_embedding IS NOT NULL
+        LEFT JOIN product_embeddings pe ON p.id = pe.product_id
+        WHERE pe.product_id IS NULL
+        ORDER BY p.rank
     ''')
+    return [dict(row) for row in cursor.fetchall()]
+
+def generate_all_embeddings(batch_size: int = 32, num_workers: int = 4):
+    """Generate embeddings for all products (batched text/image encoding)"""
+    print("=" * 50)
+    print("🚀 Generating CLIP Embeddings")
+    print("=" * 50)
     
-    results = []
-    for row in cursor.fetchall():
-        text_emb = pickle.loads(row['text_embedding'])
-        text_tensor = torch.from_numpy(text_emb)
+    products = get_all_products()
+    if not products:
+        print("❌ No products found. Run crawler first.")
+        return
+    
+    migrate_embeddings()
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    pending = _get_unembedded_products(cursor)
+    print(f"📦 {len(pending)}/{len(products)} products need embeddings (batch={batch_size}, workers={num_workers})")
+    
+    written_ids = []
+    start = time.time()
+    
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        # Decode the first batch's images ahead of time so decoding overlaps encoding
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        next_images = pool.map(_load_image, [p['image_path'] for p in batches[0]]) if batches else None
         
-        # Cosine similarity
-        similarity = (query_features @ text_tensor.T).item()
-        results.append({
-            'id': row['id'],
-            'name': row['name'],
-            'price': row['price'],
-            'score': similarity
-        })
+        for b, batch in enumerate(batches):
+            images = list(next_images)
+            if b + 1 < len(batches):
+                next_images = pool.map(_load_image, [p['image_path'] for p in batches[b + 1]])
+            
+            text_vecs = get_text_embeddings_batch([p['name'] for p in batch])
+            image_vecs = get_image_embeddings_batch(images)
+            
+            rows = []
+            for product, text_vec, image_vec in zip(batch, text_vecs, image_vecs):
+                rows.append((
+                    product['id'],
+                    encode_embedding(text_vec),
+                    encode_embedding(image_vec) if image_vec is not None else None,
+                    len(text_vec), MODEL_NAME, EMBEDDING_FORMAT_VERSION
+                ))
+            
+            cursor.executemany('''
+                INSERT OR REPLACE INTO product_embeddings
+                    (product_id, text_embedding, image_embedding,
+                     embedding_dim, embedding_model, embedding_version)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            written_ids.extend(p['id'] for p in batch)
+            
+            elapsed = time.time() - start
+            print(f"[{len(written_ids)}/{len(pending)}] {len(written_ids) / elapsed:.1f} items/sec")
     
     conn.close()
     
-    # Sort by similarity
-    results.sort(key=lambda x: x['score'], reverse=True)
-    return results[:top_k]
+    refresh_text_index(written_ids)
+    
+    elapsed = time.time() - start
+    rate = len(written_ids) / elapsed if elapsed > 0 else 0.0
+    print("\n" + "=" * 50)
+    print(f"✅ Embeddings generated! {len(written_ids)} items in {elapsed:.1f}s ({rate:.1f} items/sec)")
+    print("=" * 50)
+
+def search_by_text(query: str, top_k: int = 5, category_major: str = None, category_middle: str = None):
+    """
+    Search products by text query using CLIP.
+    With a category filter only that category's block is scored; if it has
+    fewer than top_k products the whole catalog is searched instead.
+    """
+    query_vec = encode_text_query(query)
+    if category_major is None and category_middle is None:
+        hits = get_text_index().search(query_vec, top_k)
+    else:
+        hits = get_category_index().search(query_vec, top_k, category_major, category_middle)
+    
+    return _to_results(hits)
+
+def search_multimodal(query: str, top_k: int = 5, image_weight: float = None):
+    """
+    Search products against text and image embeddings at once (CLIP shares
+    one space for both); image_weight defaults to MULTIMODAL_IMAGE_WEIGHT.
+    """
+    query_vec = encode_text_query(query)
+    return _to_results(get_multimodal_index().search(query_vec, top_k, image_weight))
+
+def search_multimodal_batch(queries, top_k: int = 5, image_weights=None):
+    """search_multimodal for many queries: one CLIP text encode, one matrix-matrix product"""
+    queries = list(queries)
+    if not queries:
+        return []
+    query_vecs = get_text_embeddings_batch(queries)
+    return [_to_results(hits) for hits in get_multimodal_index().search_batch(query_vecs, top_k, image_weights)]
+
+def search_by_image(image, top_k: int = 5, image_weight: float = None):
+    """
+    Search products with a photo: one image encode, scored against image and
+    text embeddings together; image_weight defaults to IMAGE_QUERY_WEIGHT.
+    """
+    query_vec = encode_image_query(image)
+    weight = IMAGE_QUERY_WEIGHT if image_weight is None else image_weight
+    return _to_results(get_multimodal_index().search(query_vec, top_k, weight))
+
+def _to_results(hits):
+    results = []
+    for product_id, score in hits:
+        info = _product_info[product_id]
+        results.append({
+            'id': product_id,
+            'name': info['name'],
+            'price': info['price'],
+            'category_major': info['category_major'],
+            'category_middle': info['category_middle'],
+            'score': score
+        })
+    return results
 
 if __name__ == "__main__":
     generate_all_embeddings()
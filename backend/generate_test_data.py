@@ -3,7 +3,7 @@ Test Utterance Generator for STT Testing
 Generates 3000 utterances (85% normal, 15% hard)
 """
 import random
-from database import get_connection, get_all_products, insert_utterance, get_utterance_count
+from database import get_connection, get_all_products, insert_utterances_bulk, get_utterance_count, INSERTED
 
 TARGET_TOTAL = 3000
 NORMAL_RATIO = 0.85  # 2550
@@ -71,6 +71,38 @@ def get_product_variation(name: str) -> str:
             return random.choice(variations)
     return name
 
+def make_normal_utterance(products) -> tuple:
+    product = random.choice(products)
+    template = random.choice(NORMAL_TEMPLATES)
+    
+    # Use product name or variation
+    name = get_product_variation(product['name']) if random.random() > 0.7 else product['name']
+    return (template.format(name=name), 'normal', product['id'])
+
+def make_hard_utterance(products) -> tuple:
+    product = random.choice(products)
+    template = random.choice(HARD_TEMPLATES)
+    
+    # Use shorter/informal name for hard cases
+    name = product['name'].split()[0] if len(product['name'].split()) > 1 else product['name']
+    if random.random() > 0.5:
+        name = get_product_variation(product['name'])
+    
+    return (template.format(name=name), 'hard', product['id'])
+
+def fill_utterances(make_utterance, products, target: int, label: str) -> int:
+    """Bulk-insert generated utterances until `target` new ones are stored (duplicates are regenerated)"""
+    count = 0
+    while count < target:
+        batch = [make_utterance(products) for _ in range(target - count)]
+        inserted = insert_utterances_bulk(batch).count(INSERTED)
+        if inserted == 0:
+            print(f"   ⚠️ No new {label} utterances left to generate")
+            break
+        count += inserted
+        print(f"   {label.capitalize()}: {count}/{target}")
+    return count
+
 def generate_utterances():
     """Generate 3000 test utterances"""
     print("=" * 50)
@@ -93,41 +125,13 @@ def generate_utterances():
     normal_target = int(TARGET_TOTAL * NORMAL_RATIO)
     hard_target = int(TARGET_TOTAL * HARD_RATIO)
     
-    normal_count = 0
-    hard_count = 0
-    
-    # Generate normal utterances
+    # Generate normal utterances (one transaction per round, duplicates regenerated)
     print("\n📝 Generating normal utterances...")
-    while normal_count < normal_target:
-        product = random.choice(products)
-        template = random.choice(NORMAL_TEMPLATES)
-        
-        # Use product name or variation
-        name = get_product_variation(product['name']) if random.random() > 0.7 else product['name']
-        utterance = template.format(name=name)
-        
-        if insert_utterance(utterance, 'normal', product['id']):
-            normal_count += 1
-            if normal_count % 500 == 0:
-                print(f"   Normal: {normal_count}/{normal_target}")
+    normal_count = fill_utterances(make_normal_utterance, products, normal_target, "normal")
     
     # Generate hard utterances
     print("\n📝 Generating hard utterances...")
-    while hard_count < hard_target:
-        product = random.choice(products)
-        template = random.choice(HARD_TEMPLATES)
-        
-        # Use shorter/informal name for hard cases
-        name = product['name'].split()[0] if len(product['name'].split()) > 1 else product['name']
-        if random.random() > 0.5:
-            name = get_product_variation(product['name'])
-        
-        utterance = template.format(name=name)
-        
-        if insert_utterance(utterance, 'hard', product['id']):
-            hard_count += 1
-            if hard_count % 100 == 0:
-                print(f"   Hard: {hard_count}/{hard_target}")
+    hard_count = fill_utterances(make_hard_utterance, products, hard_target, "hard")
     
     final_count = get_utterance_count()
     print("\n" + "=" * 50)
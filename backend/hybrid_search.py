@@ -0,0 +1,93 @@
+"""
+Hybrid Retrieval for Search-Roca (BM25 + vector fusion)
+Lexical and dense candidates are generated independently (each with its
+own top-k) and only the union of candidates is fused, so hybrid costs
+about the same as running either retriever alone.
+"""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from bm25_index import BM25Index
+from vector_index import top_k_indices
+
+FUSION_METHODS = ("rrf", "weighted")
+
+
+def rrf_fuse(ranked_lists: Sequence[Sequence[int]], weights: Sequence[float] = None,
+             k: int = 60) -> Dict[int, float]:
+    """Reciprocal Rank Fusion: sum of w / (k + rank) over the lists a doc appears in"""
+    weights = weights or [1.0] * len(ranked_lists)
+    fused: Dict[int, float] = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(ranked, start=1):
+            fused[doc] = fused.get(doc, 0.0) + weight / (k + rank)
+    return fused
+
+
+def _min_max(scores: Dict[int, float], candidates) -> Dict[int, float]:
+    values = [scores.get(doc, 0.0) for doc in candidates]
+    lo, hi = min(values), max(values)
+    if hi <= lo:
+        return {doc: (1.0 if hi > 0 else 0.0) for doc in candidates}
+    return {doc: (scores.get(doc, 0.0) - lo) / (hi - lo) for doc in candidates}
+
+
+def weighted_fuse(lexical: Dict[int, float], dense: Dict[int, float], alpha: float) -> Dict[int, float]:
+    """alpha * dense + (1 - alpha) * lexical, each min-max normalized over the candidate union"""
+    candidates = set(lexical) | set(dense)
+    if not candidates:
+        return {}
+    lex_norm = _min_max(lexical, candidates)
+    dense_norm = _min_max(dense, candidates)
+    return {doc: alpha * dense_norm[doc] + (1 - alpha) * lex_norm[doc] for doc in candidates}
+
+
+class HybridRetriever:
+    """
+    Documents are addressed by position: row i of `dense_matrix` and doc i of
+    `lexical` must describe the same item. Vectors are L2-normalized.
+    """
+
+    def __init__(self, lexical: BM25Index, dense_matrix: np.ndarray, fusion: str = "rrf",
+                 alpha: float = 0.5, lexical_k: int = 50, dense_k: int = 50, rrf_k: int = 60):
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion '{fusion}', expected one of {FUSION_METHODS}")
+        if len(lexical) != dense_matrix.shape[0]:
+            raise ValueError("Lexical and dense indices cover different documents")
+        self.lexical = lexical
+        self.dense_matrix = dense_matrix
+        self.fusion = fusion
+        self.alpha = alpha
+        self.lexical_k = lexical_k
+        self.dense_k = dense_k
+        self.rrf_k = rrf_k
+
+    def candidates(self, query: str, query_vec: np.ndarray) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+        """Independent top-k lists: [(doc, bm25)], [(doc, cosine)]"""
+        lexical_hits = self.lexical.search(query, top_k=self.lexical_k)
+        dense_scores = self.dense_matrix @ query_vec
+        dense_hits = [(int(i), float(dense_scores[i])) for i in top_k_indices(dense_scores, self.dense_k)]
+        return lexical_hits, dense_hits
+
+    def retrieve(self, query: str, query_vec: np.ndarray, top_k: int = 10) -> List[Tuple[int, float]]:
+        """Return [(doc, fused_score), ...] best first"""
+        lexical_hits, dense_hits = self.candidates(query, query_vec)
+
+        if self.fusion == "rrf":
+            fused = rrf_fuse(
+                [[doc for doc, _ in lexical_hits], [doc for doc, _ in dense_hits]],
+                weights=[1 - self.alpha, self.alpha], k=self.rrf_k,
+            )
+        else:
+            lexical = dict(lexical_hits)
+            dense = dict(dense_hits)
+            # Dense scores for lexical-only candidates: one small gather, not a full pass
+            extra = [doc for doc in lexical if doc not in dense]
+            if extra:
+                for doc, score in zip(extra, self.dense_matrix[extra] @ query_vec):
+                    dense[doc] = float(score)
+            fused = weighted_fuse(lexical, dense, self.alpha)
+
+        ranked = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+        return ranked[:top_k]
@@ -0,0 +1,83 @@
+"""
+On-disk embedding index artifacts for Search-Roca
+A .npy matrix plus a JSON manifest (ids, model name, content hash),
+memory-mapped read-only so worker processes share the same page cache.
+"""
+import hashlib
+import json
+import os
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+INDEX_DIR = os.path.join(os.path.dirname(__file__), 'index_cache')
+
+
+def content_hash(model_name: str, texts: List[str]) -> str:
+    """Hash of the model name and every indexed text (order-sensitive)"""
+    h = hashlib.sha256()
+    h.update(model_name.encode('utf-8'))
+    for text in texts:
+        h.update(b'\x00')
+        h.update(text.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _paths(name: str) -> Tuple[str, str]:
+    return (os.path.join(INDEX_DIR, f'{name}.npy'),
+            os.path.join(INDEX_DIR, f'{name}.json'))
+
+
+def load_index(name: str, expected_hash: str) -> Optional[Tuple[np.ndarray, list]]:
+    """Memory-map a saved index if its hash matches, else None"""
+    matrix_path, manifest_path = _paths(name)
+    if not (os.path.exists(matrix_path) and os.path.exists(manifest_path)):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('content_hash') != expected_hash:
+            return None
+        matrix = np.load(matrix_path, mmap_mode='r')
+        if matrix.shape[0] != len(manifest['ids']):
+            return None
+        return matrix, manifest['ids']
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Index '{name}' unreadable, rebuilding: {e}")
+        return None
+
+
+def save_index(name: str, matrix: np.ndarray, ids: list, model_name: str, digest: str) -> None:
+    """Write matrix + manifest atomically (temp file, then rename)"""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    matrix_path, manifest_path = _paths(name)
+    pid = os.getpid()
+
+    tmp_matrix = f'{matrix_path}.{pid}.tmp.npy'
+    np.save(tmp_matrix, np.ascontiguousarray(matrix, dtype=np.float32))
+    os.replace(tmp_matrix, matrix_path)
+
+    tmp_manifest = f'{manifest_path}.{pid}.tmp'
+    with open(tmp_manifest, 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'content_hash': digest,
+            'dim': int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            'ids': ids,
+        }, f, ensure_ascii=False)
+    os.replace(tmp_manifest, manifest_path)
+
+
+def load_or_build(name: str, model_name: str, texts: List[str], ids: list,
+                  encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+    """Return a read-only memory-mapped matrix, re-encoding only when inputs changed"""
+    digest = content_hash(model_name, texts)
+    loaded = load_index(name, digest)
+    if loaded is not None:
+        print(f"✅ Index '{name}' memory-mapped ({loaded[0].shape[0]} vectors)")
+        return loaded[0]
+
+    print(f"🔄 Building index '{name}' ({len(texts)} texts)...")
+    matrix = np.asarray(encode(texts), dtype=np.float32)
+    save_index(name, matrix, ids, model_name, digest)
+    return load_index(name, digest)[0]
@@ -0,0 +1,91 @@
+"""
+Inference Executor for Search-Roca
+Dedicated, bounded worker pool for model inference with load shedding.
+
+Requests beyond `max_workers` running + `max_queue` waiting are rejected
+immediately with QueueFullError (mapped to 503 + Retry-After by the API)
+instead of piling up on Starlette's shared threadpool.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is at capacity"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Thread pool (torch releases the GIL during inference, and the model must
+    stay in-process) with a hard cap on in-flight work.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 32,
+                 retry_after: int = 1, name: str = "inference"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._total_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "InferenceExecutor":
+        """Configure from INFERENCE_WORKERS / INFERENCE_QUEUE_DEPTH / INFERENCE_RETRY_AFTER"""
+        return cls(
+            max_workers=int(os.getenv("INFERENCE_WORKERS", "2")),
+            max_queue=int(os.getenv("INFERENCE_QUEUE_DEPTH", "32")),
+            retry_after=int(os.getenv("INFERENCE_RETRY_AFTER", "1")),
+        )
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(self.retry_after)
+            self._in_flight += 1
+
+    def _release(self, elapsed: float) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+            self._total_seconds += elapsed
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn on the pool and await it; raises QueueFullError when saturated"""
+        self._acquire()
+        start = time.perf_counter()
+        try:
+            future = self._pool.submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(0.0)
+            raise
+        # Release the slot when the work finishes, even if the caller went away
+        future.add_done_callback(lambda _: self._release(time.perf_counter() - start))
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - self.max_workers),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_seconds": round(self._total_seconds / self.completed, 4) if self.completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,326 @@
+"""
+Intent extraction for Search-Roca
+Deterministic fast path first, LLM only when the rules aren't confident:
+- category hits from category_matcher.CATEGORIES keywords
+- price ("5천원 이하", "만원대", "under 3000") and sort ("저렴한", "인기") regexes
+- optional LLM fallback (llm_client, INTENT_LLM_ENABLED=1) whose answers
+  are validated field by field and appended to a JSONL cache per LLM
+  backend, keyed on the normalized query, so a query pays the LLM round
+  trip once
+- counters report the fraction of traffic answered by the fast path (confident
+  rule hits only; low-confidence rule answers with the LLM off are rule_fallback)
+"""
+import json
+import os
+import re
+import threading
+from typing import Callable, Dict, Optional
+
+from category_matcher import CATEGORIES, best_category_match
+from korean_tokenizer import words
+from llm_client import selected_backend
+from query_cache import normalize_query
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'llm_cache')
+
+# Bump when the rule output or the default prompt changes (invalidates intent caches)
+INTENT_VERSION = 1
+
+# Filler words of kiosk questions ("물티슈 어디 있어요?")
+STOPWORDS = {
+    "어디", "있어요", "있나요", "있어", "있니", "있는", "주세요", "찾아요", "찾고", "싶어요", "사고", "좀", "혹시",
+    "가장", "제일", "제품", "상품",
+    "where", "is", "are", "the", "a", "an", "i", "need", "want", "find", "some", "for",
+}
+
+_PRICE_RE = re.compile(
+    r'(?:(\d[\d,]*(?:\.\d+)?)\s*(천|만)?|(천|만))\s*(원)?\s*'
+    r'(대|이하|미만|아래|까지|이내|안쪽|이상|초과|넘는|짜리)?'
+)
+_PRICE_EN_RE = re.compile(r'\b(under|below|less than|over|above|more than)\s*\$?(\d[\d,]*)\s*(?:won|krw)?\b',
+                          re.IGNORECASE)
+# Fields an LLM answer may override, with their expected types (a mismatch keeps the rule value)
+_FIELD_TYPES = {"is_search_intent": bool, "keywords": list, "sort": str, "needs_expansion": list}
+_FILTER_TYPES = {"category": str, "category_middle": str, "price_min": (int, float), "price_max": (int, float)}
+
+_MAX_WORDS = {"이하", "미만", "아래", "까지", "이내", "안쪽", "under", "below", "less than"}
+_MIN_WORDS = {"이상", "초과", "넘는", "over", "above", "more than"}
+_UNITS = {"천": 1000, "만": 10000}
+
+# Checked in order: "비싼" before "싼"
+_SORT_RULES = [
+    ("price_desc", re.compile(r'비싼|고급|expensive|premium', re.IGNORECASE)),
+    ("price_asc", re.compile(r'싼|저렴(?:한|하게|하고)?|가성비(?:\s*좋은)?|최저가|cheap(?:est)?', re.IGNORECASE)),
+    ("popular", re.compile(r'인기(?:\s*많은)?|잘\s*팔리는|베스트|best|popular', re.IGNORECASE)),
+    ("latest", re.compile(r'신상|새로\s*나온|최신|newest|latest', re.IGNORECASE)),
+]
+
+INTENT_PROMPT = """
+You are a 'Search Query Processor' for a Daiso product search engine.
+Extract structured intent from the user's natural language query.
+
+Categories (major > middle): {categories}
+
+Input Query: "{query}"
+
+Output JSON Format:
+{{
+    "is_search_intent": true/false,
+    "keywords": ["noun", "noun", "adjective"],
+    "filters": {{
+        "category": "major category or null",
+        "category_middle": "middle category or null",
+        "price_max": null,
+        "price_min": null
+    }},
+    "sort": "relevance" | "price_asc" | "price_desc" | "popular" | "latest",
+    "needs_expansion": ["synonym1", "synonym2"]
+}}
+"""
+
+
+def _is_price(match) -> bool:
+    """Bare numbers ("AA 4개") and bare 만/천 ("만두") are not prices"""
+    number, unit, bare_unit, won, _ = match.groups()
+    return bool(won) if bare_unit else bool(number and (unit or won))
+
+
+def parse_price(query: str) -> Dict[str, Optional[int]]:
+    """{"price_min", "price_max"} from Korean/English price phrases (None when absent)"""
+    price = {"price_min": None, "price_max": None}
+    match = _PRICE_EN_RE.search(query)
+    if match:
+        amount = int(match.group(2).replace(',', ''))
+        price["price_max" if match.group(1).lower() in _MAX_WORDS else "price_min"] = amount
+        return price
+    for match in _PRICE_RE.finditer(query):
+        if not _is_price(match):
+            continue
+        number, unit, bare_unit, _, qualifier = match.groups()
+        unit = unit or bare_unit
+        amount = float(number.replace(',', '')) if number else 1.0
+        amount = int(amount * _UNITS.get(unit, 1))
+        if amount <= 0:
+            continue
+        if qualifier in _MAX_WORDS:
+            price["price_max"] = amount
+        elif qualifier in _MIN_WORDS:
+            price["price_min"] = amount
+        elif qualifier == "대":
+            # "5천원대" -> 5000..5999, "만원대" -> 10000..19999
+            magnitude = 10 ** (len(str(amount)) - 1)
+            price.update(price_min=amount, price_max=amount + magnitude - 1)
+        else:
+            price.update(price_min=amount, price_max=amount)
+        return price
+    return price
+
+
+def parse_sort(query: str) -> str:
+    for sort, pattern in _SORT_RULES:
+        if pattern.search(query):
+            return sort
+    return "relevance"
+
+
+def rule_intent(query: str) -> dict:
+    """
+    Fast-path intent plus a confidence in [0, 1]: a multi-syllable category
+    keyword in a short query is confident; descriptive queries are not.
+    """
+    price = parse_price(query)
+    sort = parse_sort(query)
+    # Price/sort phrases are filters, not search terms
+    stripped = _PRICE_RE.sub(lambda m: ' ' if _is_price(m) else m.group(0), _PRICE_EN_RE.sub(' ', query))
+    for _, pattern in _SORT_RULES:
+        stripped = pattern.sub(' ', stripped)
+    keywords = [w for w in words(stripped) if w not in STOPWORDS]
+    hit = best_category_match(query)
+
+    if hit is None:
+        confidence = 0.3 if (price["price_max"] or price["price_min"] or sort != "relevance") else 0.0
+    else:
+        # One-syllable keywords ("자", "차", "개") are too ambiguous on their own
+        confidence = 0.9 if len(hit[0]) >= 2 else 0.5
+        # Long descriptions ("발 닦고 나서 밟는 딱딱한 거") need the LLM to read them
+        if len(keywords) > 3:
+            confidence -= 0.4
+
+    return {
+        "is_search_intent": True,
+        "keywords": keywords,
+        "filters": {
+            "category": hit[1] if hit else None,
+            "category_middle": hit[2] if hit else None,
+            **price,
+        },
+        "sort": sort,
+        "needs_expansion": [],
+        "confidence": round(max(confidence, 0.0), 2),
+    }
+
+
+def _valid(value, expected) -> bool:
+    if value is None or value == "" or value == "null":
+        return False
+    if isinstance(value, bool) and expected is not bool:
+        return False
+    if expected is list:
+        return isinstance(value, list) and all(isinstance(v, str) for v in value)
+    return isinstance(value, expected)
+
+
+def merge_intent(rule: dict, result: dict) -> dict:
+    """
+    LLM answer over the rule intent: a missing, null or wrongly typed field
+    keeps the rule value, and filters are merged key by key. Extra fields
+    (a PoC's own schema) pass through.
+    """
+    intent = dict(rule)
+    for key, value in result.items():
+        if key in ("filters", "confidence"):
+            continue
+        expected = _FIELD_TYPES.get(key)
+        if expected is None or _valid(value, expected):
+            intent[key] = value
+
+    filters = dict(rule["filters"])
+    llm_filters = result.get("filters")
+    if isinstance(llm_filters, dict):
+        for key, value in llm_filters.items():
+            expected = _FILTER_TYPES.get(key)
+            valid = _valid(value, expected) if expected else value is not None
+            if valid:
+                filters[key] = value
+    intent["filters"] = filters
+    intent["confidence"] = 1.0
+    return intent
+
+
+def llm_intent(query: str) -> dict:
+    """Default LLM fallback via the shared llm_client (raises LLMError)"""
+    from llm_client import get_client
+    categories = "; ".join(f"{major} > {', '.join(middles)}" for major, middles in CATEGORIES.items())
+    prompt = INTENT_PROMPT.replace("{categories}", categories).replace("{query}", query)
+    return get_client().generate_json(prompt)
+
+
+class IntentExtractor:
+    """
+    Rule fast path with an LLM fallback below `min_confidence`; thread-safe.
+    `llm_extract(query) -> dict` replaces the default prompt (e.g. a PoC's
+    own schema); `name` keeps each prompt's cache file separate and
+    `backend` (default: LLM_BACKEND) each LLM backend's.
+    """
+
+    def __init__(self, llm_extract: Callable[[str], dict] = None, name: str = "default",
+                 min_confidence: float = 0.6, llm_enabled: bool = True, cache_dir: Optional[str] = CACHE_DIR,
+                 backend: str = None):
+        self.llm_extract = llm_extract or llm_intent
+        self.min_confidence = min_confidence
+        self.llm_enabled = llm_enabled
+        self.backend = backend or selected_backend()
+        self.cache_path = os.path.join(cache_dir, f"intent_{name}_{self.backend}.jsonl") if cache_dir else None
+        self._cache: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.fast_path = 0
+        self.rule_fallback = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.llm_errors = 0
+        self._load()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "IntentExtractor":
+        """
+        Configure from INTENT_MIN_CONFIDENCE / INTENT_LLM_ENABLED / INTENT_CACHE.
+        The LLM is off by default: its call would block the search request.
+        """
+        options = dict(
+            min_confidence=float(os.getenv("INTENT_MIN_CONFIDENCE", "0.6")),
+            llm_enabled=os.getenv("INTENT_LLM_ENABLED", "0") == "1",
+            cache_dir=CACHE_DIR if os.getenv("INTENT_CACHE", "1") == "1" else None,
+        )
+        options.update(kwargs)
+        return cls(**options)
+
+    def _load(self) -> None:
+        """Replay the JSONL cache (later lines win; a torn last line is ignored)"""
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if entry['version'] == INTENT_VERSION:
+                            self._cache[entry['key']] = entry['intent']
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except OSError:
+            return
+
+    def _append(self, key: str, intent: dict) -> None:
+        """One line per new intent instead of rewriting the whole cache"""
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        line = json.dumps({'version': INTENT_VERSION, 'key': key, 'intent': intent}, ensure_ascii=False)
+        with open(self.cache_path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def extract(self, query: str) -> dict:
+        """Intent dict with "source": "rule", "cache", "llm" or "fallback" (LLM failed, rule intent)"""
+        self._count("requests")
+        rule = rule_intent(query)
+        if rule["confidence"] >= self.min_confidence:
+            self._count("fast_path")
+            return {**rule, "source": "rule"}
+        if not self.llm_enabled:
+            # Low-confidence rule intent served as is: not a fast-path hit
+            self._count("rule_fallback")
+            return {**rule, "source": "rule"}
+
+        key = normalize_query(query)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            self._count("cache_hits")
+            return {**cached, "source": "cache"}
+
+        self._count("llm_calls")
+        try:
+            result = self.llm_extract(query)
+        except Exception as e:
+            # LLM unavailable: the low-confidence rule intent is still usable
+            print(f"⚠️ Intent LLM fallback failed: {e}")
+            self._count("llm_errors")
+            return {**rule, "source": "fallback"}
+        if not isinstance(result, dict):
+            self._count("llm_errors")
+            return {**rule, "source": "fallback"}
+
+        intent = merge_intent(rule, result)
+        with self._lock:
+            self._cache[key] = intent
+            self._append(key, intent)
+        return {**intent, "source": "llm"}
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "fast_path": self.fast_path,
+            "fast_path_ratio": round(self.fast_path / self.requests, 4) if self.requests else 0.0,
+            "rule_fallback": self.rule_fallback,
+            "cache_hits": self.cache_hits,
+            "llm_calls": self.llm_calls,
+            "llm_errors": self.llm_errors,
+            "cached_intents": len(self._cache),
+            "min_confidence": self.min_confidence,
+            "backend": self.backend,
+        }
@@ -27,6 +27,22 @@ CATEGORY_ZONES = {
     "cashier": {"x": 10, "y": 2, "name": "계산대"}
 }
 
+# Catalog (products.db) major categories -> store zone
+CATEGORY_MAJOR_ZONES = {
+    "뷰티/위생": "bathroom",
+    "주방용품": "kitchen",
+    "청소/욕실": "cleaning",
+    "수납/정리": "event",
+    "문구/팬시": "kids",
+    "인테리어/원예": "event",
+    "공구/디지털": "electronics",
+    "식품": "food",
+    "스포츠/레저/취미": "camping",
+    "패션/잡화": "kids",
+    "반려동물": "event",
+    "유아/완구": "kids",
+}
+
 INVENTORY_DB = [
     {
         "id": 1,
@@ -99,3 +115,8 @@ def get_all_items():
 
 def get_map_config():
     return MAP_CONFIG
+
+def get_zone_location(category_major: str):
+    """Location of the zone a catalog category is shelved in (event zone if unknown)"""
+    zone = CATEGORY_ZONES[CATEGORY_MAJOR_ZONES.get(category_major, "event")]
+    return {"x": zone["x"], "y": zone["y"], "desc": f"{zone['name']} 코너"}
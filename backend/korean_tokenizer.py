@@ -0,0 +1,128 @@
+"""
+Korean-aware tokenizer for Search-Roca lexical search
+Dependency-free: word tokens with trailing particles (조사) stripped, plus
+Hangul syllable bigrams so compounds like "욕실매트" and "욕실 매트" share
+terms. A JSON token cache keeps the catalog from being re-tokenized on startup.
+"""
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from typing import Dict, List
+
+# Bump when tokenization output changes (invalidates token caches / saved indices)
+TOKENIZER_VERSION = 2
+
+_WORD_RE = re.compile(r'[0-9a-z]+|[가-힣]+|[^\W\d_a-z가-힣]+', re.UNICODE)
+_HANGUL_RE = re.compile(r'^[가-힣]+$')
+
+# Common trailing particles/endings, longest first
+PARTICLES = sorted([
+    "에서는", "으로는", "이랑", "에서", "으로", "에게", "한테", "까지", "부터", "처럼", "보다",
+    "이나", "이요", "은", "는", "이", "가", "을", "를", "에", "로", "의", "도", "와", "과",
+    "랑", "만", "요", "나",
+], key=len, reverse=True)
+
+
+def normalize(text: str) -> str:
+    """NFKC + lower-case"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def compact(text: str) -> str:
+    """Normalized text with all whitespace removed ("욕실 매트" -> "욕실매트")"""
+    return re.sub(r'\s+', '', normalize(text))
+
+
+def strip_particle(word: str) -> str:
+    """Remove one trailing particle if at least two syllables remain"""
+    if not _HANGUL_RE.match(word):
+        return word
+    for particle in PARTICLES:
+        if word.endswith(particle) and len(word) - len(particle) >= 2:
+            return word[:-len(particle)]
+    return word
+
+
+def syllable_ngrams(word: str, n: int = 2) -> List[str]:
+    """Character n-grams of a Hangul word ("욕실매트" -> 욕실, 실매, 매트)"""
+    if len(word) <= n or not _HANGUL_RE.match(word):
+        return []
+    return [word[i:i + n] for i in range(len(word) - n + 1)]
+
+
+def words(text: str) -> List[str]:
+    """Word tokens (script runs) with particles stripped"""
+    return [strip_particle(w) for w in _WORD_RE.findall(normalize(text))]
+
+
+def korean_tokenize(text: str) -> List[str]:
+    """
+    Words (particles stripped) plus syllable bigrams of the original word, so
+    stripping never drops a bigram ("케이블타이" keeps "타이"); suitable for
+    BM25 and term matching
+    """
+    tokens = []
+    for word in _WORD_RE.findall(normalize(text)):
+        tokens.append(strip_particle(word))
+        tokens.extend(syllable_ngrams(word))
+    return tokens
+
+
+class TokenCache:
+    """
+    Persistent text -> tokens cache (keyed by a hash of the text), so a
+    catalog is only tokenized once per tokenizer version.
+    """
+
+    def __init__(self, path: str, tokenizer=korean_tokenize):
+        self.path = path
+        self.tokenizer = tokenizer
+        self._tokens: Dict[str, List[str]] = {}
+        self._dirty = False
+        self._load()
+
+    def _signature(self) -> str:
+        return f"{getattr(self.tokenizer, '__name__', 'tokenizer')}:{TOKENIZER_VERSION}"
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return
+        if payload.get('signature') == self._signature():
+            self._tokens = payload.get('tokens', {})
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def tokenize(self, text: str) -> List[str]:
+        key = self._key(text)
+        tokens = self._tokens.get(key)
+        if tokens is None:
+            tokens = self.tokenizer(text)
+            self._tokens[key] = tokens
+            self._dirty = True
+        return tokens
+
+    def tokenize_many(self, texts: List[str]) -> List[List[str]]:
+        """Tokenize a catalog, reusing cached entries, and persist new ones"""
+        result = [self.tokenize(t) for t in texts]
+        self.save()
+        return result
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'signature': self._signature(), 'tokens': self._tokens},
+                      f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self._dirty = False
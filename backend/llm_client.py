@@ -0,0 +1,336 @@
+"""
+LLM Client for Search-Roca
+One entry point for every LLM call (intent extraction, reranking, ...):
+- backends: "gemini" (google-generativeai, the default), and as explicit
+  LLM_BACKEND opt-ins "stub" (deterministic, offline) and "http" (a local
+  stand-in server: `python llm_client.py --serve`)
+- disk response cache keyed on (backend, model, prompt hash)
+- bounded concurrency, per-call timeout, retries with backoff
+- JSON parsing that tolerates ```json fences and surrounding prose
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Optional
+
+DEFAULT_MODEL = 'gemini-2.0-flash'
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'llm_cache')
+LLM_BACKENDS = ("gemini", "stub", "http")
+
+_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$', re.IGNORECASE)
+_STUB_QUERY_RE = re.compile(r'(?:Query|검색어|Sentence\]?)\s*:?\s*"([^"]+)"', re.IGNORECASE)
+_STUB_ID_RE = re.compile(r'ID\s+([\w-]+)\s*:')
+
+
+class LLMError(Exception):
+    """Backend call failed (after retries) or timed out"""
+
+
+def parse_json(text: str):
+    """Parse a JSON object/array from an LLM response (fences and prose stripped)"""
+    text = _FENCE_RE.sub('', (text or '').strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Fall back to the outermost {...} or [...] block
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if starts:
+        start = min(starts)
+        end = text.rfind('}' if text[start] == '{' else ']')
+        if end > start:
+            return json.loads(text[start:end + 1])
+    raise ValueError(f"No JSON found in LLM response: {text[:80]!r}")
+
+
+# ===========================
+# Backends
+# ===========================
+
+class GeminiBackend:
+    """google-generativeai; one GenerativeModel per (model, json_mode)"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str = None):
+        api_key = api_key or os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise LLMError("GOOGLE_API_KEY / GEMINI_API_KEY not set (LLM_BACKEND=stub runs offline)")
+        # Lazy import: only needed when this backend is selected
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self._models = {}
+
+    def generate(self, model_name: str, prompt: str, json_mode: bool, timeout: float) -> str:
+        key = (model_name, json_mode)
+        if key not in self._models:
+            config = {"response_mime_type": "application/json"} if json_mode else None
+            self._models[key] = self._genai.GenerativeModel(model_name, generation_config=config)
+        response = self._models[key].generate_content(prompt, request_options={"timeout": timeout})
+        return response.text
+
+
+class StubBackend:
+    """
+    Deterministic offline responses for benchmarking the pipeline: picks the
+    first candidate ID in the prompt and echoes the query as keywords.
+    `latency_ms` simulates model time.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000.0
+
+    def generate(self, model_name: str, prompt: str, json_mode: bool, timeout: float) -> str:
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+            if self.latency > timeout:
+                raise TimeoutError(f"stub latency {self.latency}s exceeds timeout {timeout}s")
+        # Prompts may contain few-shot examples: use the last query and the IDs after it
+        matches = list(_STUB_QUERY_RE.finditer(prompt))
+        query = matches[-1].group(1) if matches else ""
+        tail = prompt[matches[-1].end():] if matches else prompt
+        ids = [int(i) if i.isdigit() else i for i in _STUB_ID_RE.findall(tail)]
+        top = ids[0] if ids else None
+        return json.dumps({
+            "is_search_intent": True,
+            "keywords": query.split(),
+            "keyword": query,
+            "filters": {},
+            "sort": "relevance",
+            "needs_expansion": [],
+            "ranked_ids": ids,
+            "top_match_id": top,
+            "selected_id": top,
+            "reason": "stub response",
+        }, ensure_ascii=False)
+
+
+class HTTPBackend:
+    """POST {"model", "prompt", "json"} -> {"text"} (see serve())"""
+
+    name = "http"
+
+    def __init__(self, url: str = None):
+        self.url = url or os.getenv("LLM_HTTP_URL", "http://127.0.0.1:8765/generate")
+
+    def generate(self, model_name: str, prompt: str, json_mode: bool, timeout: float) -> str:
+        import urllib.request
+        body = json.dumps({"model": model_name, "prompt": prompt, "json": json_mode}).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))["text"]
+
+
+def selected_backend() -> str:
+    """LLM_BACKEND (default "gemini"; the stub is never picked implicitly)"""
+    return os.getenv("LLM_BACKEND", "gemini")
+
+
+def create_backend(name: str = None):
+    """Backend from LLM_BACKEND; gemini without an API key raises LLMError"""
+    name = name or selected_backend()
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "stub":
+        return StubBackend(float(os.getenv("LLM_STUB_LATENCY_MS", "0")))
+    if name == "http":
+        return HTTPBackend()
+    raise ValueError(f"Unknown LLM_BACKEND '{name}', expected one of {LLM_BACKENDS}")
+
+
+# ===========================
+# Client
+# ===========================
+
+class LLMClient:
+    """Thread-safe; share one instance (see get_client())"""
+
+    def __init__(self, backend, model_name: str = DEFAULT_MODEL, cache_dir: Optional[str] = CACHE_DIR,
+                 timeout: float = 20.0, max_concurrency: int = 4, retries: int = 2, backoff: float = 0.5,
+                 rate_limiter: Optional[Callable[[], None]] = None):
+        self.backend = backend
+        # Part of the cache key: stub/http answers must never be served as Gemini ones
+        self.backend_name = getattr(backend, "name", type(backend).__name__)
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Blocking callable run before every backend request (cache hits are free)
+        self.rate_limiter = rate_limiter
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.fallbacks = 0
+        self._total_ms = 0.0
+
+    @classmethod
+    def from_env(cls) -> "LLMClient":
+        """Configure from LLM_BACKEND / LLM_MODEL / LLM_TIMEOUT / LLM_MAX_CONCURRENCY / LLM_RETRIES / LLM_CACHE"""
+        return cls(
+            create_backend(),
+            model_name=os.getenv("LLM_MODEL", DEFAULT_MODEL),
+            cache_dir=CACHE_DIR if os.getenv("LLM_CACHE", "1") == "1" else None,
+            timeout=float(os.getenv("LLM_TIMEOUT", "20")),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+            retries=int(os.getenv("LLM_RETRIES", "2")),
+        )
+
+    def _count(self, name: str, value=1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    # Disk cache: one small JSON file per response
+    def _cache_path(self, prompt: str, json_mode: bool) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        key = f"{self.backend_name}\x00{self.model_name}\x00{int(json_mode)}\x00{prompt}"
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def _cache_get(self, path: Optional[str]) -> Optional[str]:
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _cache_put(self, path: Optional[str], text: str) -> None:
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"backend": self.backend_name, "model": self.model_name, "text": text}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _call(self, prompt: str, json_mode: bool) -> str:
+        """Backend call with bounded concurrency, timeout and retries"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise LLMError(f"No LLM slot free within {self.timeout}s")
+        try:
+            last_error = None
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(self.backoff * (2 ** (attempt - 1)))
+                if self.rate_limiter is not None:
+                    self.rate_limiter()
+                start = time.perf_counter()
+                try:
+                    text = self.backend.generate(self.model_name, prompt, json_mode, self.timeout)
+                except Exception as e:
+                    last_error = e
+                    continue
+                finally:
+                    self._count("calls")
+                    self._count("_total_ms", (time.perf_counter() - start) * 1000)
+                return text
+            self._count("errors")
+            raise LLMError(f"LLM call failed after {self.retries + 1} attempts: {last_error}") from last_error
+        finally:
+            self._slots.release()
+
+    def generate(self, prompt: str, json_mode: bool = False, use_cache: bool = True) -> str:
+        """Raw response text; raises LLMError"""
+        path = self._cache_path(prompt, json_mode) if use_cache else None
+        cached = self._cache_get(path)
+        if cached is not None:
+            self._count("cache_hits")
+            return cached
+        text = self._call(prompt, json_mode)
+        self._cache_put(path, text)
+        return text
+
+    def generate_json(self, prompt: str, fallback=None, json_mode: bool = True, use_cache: bool = True):
+        """
+        Parsed JSON response. On any failure (timeout, backend error, bad JSON)
+        returns `fallback` if given, otherwise raises LLMError.
+        """
+        path = self._cache_path(prompt, json_mode) if use_cache else None
+        try:
+            return parse_json(self.generate(prompt, json_mode, use_cache))
+        except (LLMError, ValueError) as e:
+            # Never keep an unparseable response in the cache
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+            if fallback is None:
+                raise LLMError(str(e)) from e
+            print(f"⚠️ LLM fallback: {e}")
+            self._count("fallbacks")
+            return fallback
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend_name,
+            "model": self.model_name,
+            "max_concurrency": self.max_concurrency,
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "errors": self.errors,
+            "fallbacks": self.fallbacks,
+            "avg_call_ms": round(self._total_ms / self.calls, 3) if self.calls else 0.0,
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """Shared client configured from the environment (created on first use)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient.from_env()
+    return _client
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, latency_ms: float = 0.0) -> None:
+    """Local stand-in LLM server (stub responses) for the "http" backend"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    stub = StubBackend(latency_ms)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            text = stub.generate(payload.get("model", DEFAULT_MODEL), payload["prompt"],
+                                 payload.get("json", False), timeout=60.0)
+            body = json.dumps({"text": text}, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    print(f"🤖 Stub LLM server on http://{host}:{port}/generate (latency {latency_ms}ms)")
+    ThreadingHTTPServer((host, port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stand-in LLM server")
+    parser.add_argument('--serve', action='store_true')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.host, args.port, args.latency_ms)
+    else:
+        parser.print_help()
@@ -1,10 +1,51 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-# will import search engine later
 
-app = FastAPI(title="Search-Roca API")
+# Cheap to import: the model and index are loaded by search_engine.load()
+import database
+import search_engine
+from inference_executor import InferenceExecutor, QueueFullError
+from micro_batcher import MicroBatcher
+from upload_limits import MAX_UPLOAD_BYTES, InvalidUploadError
+
+# Dedicated, bounded pool for torch inference (see INFERENCE_* env vars)
+executor = InferenceExecutor.from_env()
+
+# Concurrent /api/search requests are encoded together (see MICROBATCH_* env vars)
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "1") == "1"
+batcher = MicroBatcher.from_env(search_engine.search_batch, executor)
+# Multimodal requests are batched as (query, image_weight) pairs
+multimodal_batcher = MicroBatcher.from_env(search_engine.search_multimodal_batch, executor)
+
+def _load_and_warm_up():
+    try:
+        search_engine.warm_up()
+        print("✅ Search engine ready")
+    except Exception as e:
+        print(f"❌ Search engine failed to load: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load model + index in the background so the app answers immediately
+    loop = asyncio.get_running_loop()
+    app.state.loader = loop.run_in_executor(None, _load_and_warm_up)
+    if MICROBATCH_ENABLED:
+        batcher.start()
+        multimodal_batcher.start()
+    yield
+    await batcher.stop()
+    await multimodal_batcher.stop()
+    executor.shutdown()
+    # Queued jobs are cancelled by now; close (with WAL, checkpoint) the DB connections
+    database.close_pool()
+
+app = FastAPI(title="Search-Roca API", lifespan=lifespan)
 
 # Allow CORS for Next.js frontend
 app.add_middleware(
@@ -15,21 +56,112 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Upper bound on queries per /api/search/batch request
+MAX_BATCH_QUERIES = 1000
+
+# Upper bound on results per query (each distinct top_k is its own result-cache key)
+MAX_TOP_K = 50
+
 class SearchQuery(BaseModel):
     query: str
     context: Optional[str] = None
+    # Opt-in: search the product catalog on CLIP text + image embeddings
+    multimodal: bool = False
+    image_weight: Optional[float] = Field(None, ge=0.0, le=1.0)
+
+class BatchSearchQuery(BaseModel):
+    queries: List[str]
+    top_k: int = Field(3, ge=1, le=MAX_TOP_K)
 
 @app.get("/")
 def read_root():
     return {"status": "Search-Roca Backend Running"}
 
-import search_engine
+@app.get("/health/live")
+def health_live():
+    """Liveness: the process is up and serving"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def health_ready():
+    """Readiness: model and index are loaded and warmed up"""
+    status = search_engine.get_status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status, headers={"Retry-After": "5"})
+    return status
+
+@app.get("/api/metrics")
+def metrics():
+    """Cache hit/miss counters for monitoring"""
+    return {"cache": search_engine.get_cache_stats(), "executor": executor.stats(),
+            "micro_batcher": batcher.stats(), "multimodal_batcher": multimodal_batcher.stats(),
+            "reranker": search_engine.get_reranker_stats(),
+            "intent": search_engine.get_intent_stats()}
+
+@app.post("/api/warmup")
+def warmup():
+    """Explicit warm-up: loads if needed and runs a few dummy queries"""
+    try:
+        return search_engine.warm_up()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _overloaded(e: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=503, detail="Search is overloaded, retry shortly",
+                         headers={"Retry-After": str(e.retry_after)})
 
 @app.post("/api/search")
-def search_items(payload: SearchQuery):
+async def search_items(payload: SearchQuery):
+    if not search_engine.is_ready():
+        raise HTTPException(status_code=503, detail="Search engine is still loading",
+                            headers={"Retry-After": "5"})
     try:
-        results = search_engine.search(payload.query)
+        if payload.multimodal:
+            if MICROBATCH_ENABLED:
+                return await multimodal_batcher.submit((payload.query, payload.image_weight))
+            return await executor.run(search_engine.search_multimodal, payload.query,
+                                      image_weight=payload.image_weight)
+        if MICROBATCH_ENABLED:
+            return await batcher.submit(payload.query)
+        results = await executor.run(search_engine.search, payload.query)
         return results
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/search/batch")
+async def search_items_batch(payload: BatchSearchQuery):
+    """N queries (e.g. STT n-best hypotheses) in one encode + one similarity pass"""
+    if len(payload.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    if not search_engine.is_ready():
+        raise HTTPException(status_code=503, detail="Search engine is still loading",
+                            headers={"Retry-After": "5"})
+    try:
+        results = await executor.run(search_engine.search_batch, payload.queries, top_k=payload.top_k)
+        return {"results": results}
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/search/image")
+async def search_items_by_image(file: UploadFile = File(...), top_k: int = Form(3, ge=1, le=MAX_TOP_K),
+                                image_weight: Optional[float] = Form(None, ge=0.0, le=1.0)):
+    """Search by photo: the upload is decoded/downscaled and encoded once with CLIP"""
+    # CLIP is imported/loaded inside the executor job, never on the event loop
+    # Read at most one byte past the limit instead of buffering arbitrary uploads
+    data = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image must be at most {MAX_UPLOAD_BYTES} bytes")
+    try:
+        return await executor.run(search_engine.search_by_image, data, top_k=top_k,
+                                  image_weight=image_weight)
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
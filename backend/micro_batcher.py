@@ -0,0 +1,124 @@
+"""
+Micro-batcher for Search-Roca
+Collects concurrent requests for a few milliseconds (or until the batch is
+full), runs them as one batch, and scatters results back to the awaiting
+callers. CPU transformer inference is much cheaper per item when batched.
+"""
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Callable, List, Optional
+
+from inference_executor import InferenceExecutor, QueueFullError
+
+# Batch-size histogram buckets (upper bounds, inclusive)
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class MicroBatcher:
+    """
+    `process_batch(items) -> results` must return one result per item, in order.
+    It runs on `executor` so the event loop never blocks on inference.
+    """
+
+    def __init__(self, process_batch: Callable[[list], list], executor: InferenceExecutor,
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0,
+                 max_pending: Optional[int] = None):
+        self.process_batch = process_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_pending = max_pending or max_batch_size * max(1, executor.max_queue)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._dispatches = set()
+        self.batch_sizes = Counter()
+        self.items_processed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, process_batch, executor: InferenceExecutor) -> "MicroBatcher":
+        """Configure from MICROBATCH_MAX_SIZE / MICROBATCH_WAIT_MS"""
+        return cls(
+            process_batch, executor,
+            max_batch_size=int(os.getenv("MICROBATCH_MAX_SIZE", "16")),
+            max_wait_ms=float(os.getenv("MICROBATCH_WAIT_MS", "5")),
+        )
+
+    def start(self) -> None:
+        """Start the collector task on the running loop (idempotent)"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._collect())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, item):
+        """Enqueue one item and await its result; raises QueueFullError when saturated"""
+        self.start()
+        if self._queue.qsize() >= self.max_pending:
+            self.rejected += 1
+            raise QueueFullError(self.executor.retry_after)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without waiting so the next batch can form while this one runs
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[tuple]) -> None:
+        items = [item for item, _ in batch]
+        self.batch_sizes[len(batch)] += 1
+        try:
+            results = await self.executor.run(self.process_batch, items)
+        except BaseException as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        self.items_processed += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        histogram = {f"<={bound}": 0 for bound in HISTOGRAM_BUCKETS}
+        histogram[f">{HISTOGRAM_BUCKETS[-1]}"] = 0
+        for size, count in self.batch_sizes.items():
+            bucket = next((f"<={b}" for b in HISTOGRAM_BUCKETS if size <= b), f">{HISTOGRAM_BUCKETS[-1]}")
+            histogram[bucket] += count
+        batches = sum(self.batch_sizes.values())
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "batches": batches,
+            "items": self.items_processed,
+            "avg_batch_size": round(self.items_processed / batches, 3) if batches else 0.0,
+            "rejected": self.rejected,
+            "batch_size_histogram": histogram,
+        }
@@ -0,0 +1,130 @@
+"""
+Cross-Encoder Reranker for Search-Roca
+Optional second stage over the first-stage top-N candidates:
+- (query, product text) pairs are scored in batched predict calls
+- pair scores are cached by (normalized query, product id, model)
+- a latency budget keeps the first-stage order when scoring runs over
+"""
+import os
+import threading
+import time
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+from query_cache import LRUCache, normalize_query
+
+DEFAULT_RERANK_MODEL = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+# (doc_id, text, first_stage_score)
+Candidate = Tuple[Hashable, str, float]
+
+
+class CrossEncoderReranker:
+    """Lazily loads a sentence-transformers CrossEncoder; thread-safe"""
+
+    def __init__(self, model_name: str = DEFAULT_RERANK_MODEL, batch_size: int = 32,
+                 budget_ms: Optional[float] = 150.0, cache_size: int = 4096,
+                 cache_ttl: Optional[float] = None, model=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget = budget_ms / 1000.0 if budget_ms else None
+        self._model = model
+        self._load_lock = threading.Lock()
+        self._cache = LRUCache(cache_size, cache_ttl)
+        self.reranked = 0
+        self.fallbacks = 0
+        self.pairs_scored = 0
+        self._total_ms = 0.0
+        self._calls = 0
+
+    @classmethod
+    def from_env(cls) -> "CrossEncoderReranker":
+        """Configure from RERANK_MODEL / RERANK_BATCH_SIZE / RERANK_BUDGET_MS / RERANK_CACHE_SIZE"""
+        return cls(
+            model_name=os.getenv("RERANK_MODEL", DEFAULT_RERANK_MODEL),
+            batch_size=int(os.getenv("RERANK_BATCH_SIZE", "32")),
+            budget_ms=float(os.getenv("RERANK_BUDGET_MS", "150")),
+            cache_size=int(os.getenv("RERANK_CACHE_SIZE", "4096")),
+        )
+
+    def load(self):
+        with self._load_lock:
+            if self._model is None:
+                # Lazy import: torch/transformers import alone takes seconds
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def rerank(self, query: str, candidates: Sequence[Candidate], top_k: int = 5) -> List[Tuple[Hashable, float]]:
+        """Return [(doc_id, score), ...] best first (first-stage scores on fallback)"""
+        ranked, _ = self.rerank_batch([query], [candidates], top_k)
+        return ranked[0]
+
+    def rerank_batch(self, queries: Sequence[str], candidate_lists: Sequence[Sequence[Candidate]],
+                     top_k: int = 5) -> Tuple[List[List[Tuple[Hashable, float]]], List[bool]]:
+        """
+        Rerank several queries with their uncached pairs pooled into shared
+        predict batches. Returns (ranked lists, reranked flags); a query whose
+        pairs were not all scored within the budget keeps its first-stage order.
+        """
+        model = self.load()
+        start = time.perf_counter()
+        deadline = start + self.budget if self.budget else None
+
+        keys = [[(normalize_query(q), doc_id, self.model_name) for doc_id, _, _ in candidates]
+                for q, candidates in zip(queries, candidate_lists)]
+        scores = {}
+        pending, pending_pairs = [], []
+        for q, candidates, query_keys in zip(queries, candidate_lists, keys):
+            for (_, text, _), key in zip(candidates, query_keys):
+                if key in scores:
+                    continue
+                cached = self._cache.get(key)
+                scores[key] = cached
+                if cached is None:
+                    pending.append(key)
+                    pending_pairs.append((q, text))
+
+        # Pending pairs are in query order, so early queries finish first on timeout
+        for i in range(0, len(pending), self.batch_size):
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            batch_scores = model.predict(pending_pairs[i:i + self.batch_size], batch_size=self.batch_size)
+            # A predict that overran the budget isn't used now (its queries keep
+            # first-stage order) but its scores are cached for the next request
+            late = deadline is not None and time.perf_counter() > deadline
+            for key, score in zip(pending[i:i + self.batch_size], batch_scores):
+                if not late:
+                    scores[key] = float(score)
+                self._cache.put(key, float(score))
+            self.pairs_scored += len(batch_scores)
+            if late:
+                break
+
+        ranked_lists, flags = [], []
+        for candidates, query_keys in zip(candidate_lists, keys):
+            if all(scores[key] is not None for key in query_keys):
+                ranked = sorted(((doc_id, scores[key]) for (doc_id, _, _), key in zip(candidates, query_keys)),
+                                key=lambda kv: kv[1], reverse=True)
+                self.reranked += 1
+                flags.append(True)
+            else:
+                ranked = [(doc_id, score) for doc_id, _, score in candidates]
+                self.fallbacks += 1
+                flags.append(False)
+            ranked_lists.append(ranked[:top_k])
+
+        self._calls += 1
+        self._total_ms += (time.perf_counter() - start) * 1000
+        return ranked_lists, flags
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "batch_size": self.batch_size,
+            "budget_ms": self.budget * 1000.0 if self.budget else None,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "pairs_scored": self.pairs_scored,
+            "avg_ms": round(self._total_ms / self._calls, 3) if self._calls else 0.0,
+            "pair_cache": self._cache.stats(),
+        }
@@ -1,67 +1,298 @@
-from sentence_transformers import SentenceTransformer, util
+import os
+import threading
+import time
 import numpy as np
 import inventory
+import index_store
+from bm25_index import BM25Index
+from korean_tokenizer import TokenCache, TOKENIZER_VERSION, korean_tokenize
+from hybrid_search import HybridRetriever
+from intent import IntentExtractor
+from query_cache import LRUCache, normalize_query
+from reranker import CrossEncoderReranker
+from vector_index import top_k_indices
 import re
 
-# Load model (can be swapped for a lighter one if needed)
+# Model (can be swapped for a lighter one if needed)
 # 'all-MiniLM-L6-v2' is fast and good for this.
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Loaded lazily by load() so importing this module stays cheap.
+MODEL_NAME = 'all-MiniLM-L6-v2'
+model = None
 
-# Prepare inventory embeddings
+# Typical kiosk queries used to warm up torch kernels/allocations
+WARMUP_QUERIES = ["물티슈 어디 있어요?", "건전지", "bathroom mat", "travel shampoo"]
+
+# Prepare inventory texts
 items = inventory.get_all_items()
 # We construct a "searchable text" for each item: Name + Keywords + Category
 item_texts = [f"{item['name']} {', '.join(item['keywords'])} {item['category']}" for item in items]
-item_embeddings = model.encode(item_texts, convert_to_tensor=True)
+item_embeddings = None
+
+# Retrieval mode: "vector" (dense only) or "hybrid" (BM25 + vector fusion)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")        # "rrf" or "weighted"
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))   # weight of the dense side
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+retriever = None
+
+# Optional cross-encoder second stage over the first-stage top-N (see RERANK_* env vars)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+reranker = CrossEncoderReranker.from_env() if RERANK_ENABLED else None
+
+# Intent: rule fast path; the LLM fallback is opt-in (INTENT_LLM_ENABLED=1, see INTENT_* env vars)
+intent_extractor = IntentExtractor.from_env()
+
+# Query caches (kiosk traffic is highly repetitive)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+_vector_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+_result_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+_load_lock = threading.Lock()
+_status = {"state": "not_loaded", "error": None, "load_seconds": None, "warmup_seconds": None}
+
+def encode_texts(texts):
+    """Encode texts into L2-normalized float32 vectors (dot product == cosine)"""
+    return model.encode(texts, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+
+def encode_queries(queries):
+    """Encode queries through the LRU vector cache; misses are encoded in one call"""
+    keys = [(MODEL_NAME, normalize_query(q)) for q in queries]
+    vectors = [_vector_cache.get(key) for key in keys]
+    
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        encoded = encode_texts([queries[i] for i in missing])
+        for i, vec in zip(missing, encoded):
+            vectors[i] = vec
+            _vector_cache.put(keys[i], vec)
+    
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack(vectors)
+
+def invalidate_caches():
+    """Drop cached vectors/results (call whenever the item index is rebuilt)"""
+    _vector_cache.clear()
+    _result_cache.clear()
 
-def analyze_intent_dummy(query: str):
+def get_cache_stats() -> dict:
+    return {"query_vectors": _vector_cache.stats(), "results": _result_cache.stats()}
+
+def get_reranker_stats() -> dict:
+    if reranker is None:
+        return {"enabled": False}
+    return {"enabled": True, **reranker.stats()}
+
+def get_intent_stats() -> dict:
+    return intent_extractor.stats()
+
+def load():
+    """Load the model and the inventory index (idempotent, thread-safe)"""
+    global model, item_embeddings, retriever
+    with _load_lock:
+        if item_embeddings is not None:
+            return
+        _status["state"] = "loading"
+        start = time.time()
+        try:
+            # Lazy import: torch/transformers import alone takes seconds
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(MODEL_NAME)
+            # Memory-mapped from index_cache/; only re-encoded when the inventory or model changes
+            embeddings = index_store.load_or_build(
+                'inventory', MODEL_NAME, item_texts, [item['id'] for item in items], encode_texts
+            )
+            if SEARCH_MODE == "hybrid":
+                lexical = BM25Index.load_or_build(
+                    os.path.join(index_store.INDEX_DIR, 'inventory_bm25.json'),
+                    item_texts, tokenizer=korean_tokenize,
+                    fingerprint=index_store.content_hash(f'bm25:{TOKENIZER_VERSION}', item_texts),
+                    token_cache=TokenCache(os.path.join(index_store.INDEX_DIR, 'inventory_tokens.json')),
+                )
+                retriever = HybridRetriever(
+                    lexical, embeddings, fusion=HYBRID_FUSION, alpha=HYBRID_ALPHA,
+                    lexical_k=HYBRID_CANDIDATES, dense_k=HYBRID_CANDIDATES,
+                )
+            if reranker is not None:
+                reranker.load()
+            invalidate_caches()
+            # Assigned last: a concurrent load() returns only once everything is in place
+            item_embeddings = embeddings
+        except Exception as e:
+            _status.update(state="failed", error=str(e))
+            raise
+        _status.update(state="loaded", error=None, load_seconds=round(time.time() - start, 3))
+
+def warm_up(queries=None):
+    """Run dummy queries so the first real query doesn't pay JIT/allocation costs"""
+    load()
+    start = time.time()
+    for q in queries or WARMUP_QUERIES:
+        search(q)
+    _status.update(state="ready", warmup_seconds=round(time.time() - start, 3))
+    return dict(_status)
+
+def is_ready() -> bool:
+    """Ready only once warm-up finished, so traffic never hits a cold model"""
+    return _status["state"] == "ready"
+
+def get_status() -> dict:
+    return {**_status, "ready": is_ready()}
+
+def analyze_intent(query: str):
     """
-    Mock LLM Intent Analysis.
-    In a real scenario, this would call Gemini API.
-    For now, we heuristically extract key terms.
+    Intent Analysis: category/price/sort rules first, the LLM only when
+    the rules aren't confident (results cached by normalized query).
     """
-    # Simple rule-based extraction for prototype
+    intent = intent_extractor.extract(query)
     # Detect context
     context = []
     if "travel" in query.lower() or "trip" in query.lower():
         context.append("Travel")
     if "bathroom" in query.lower() or "shower" in query.lower():
         context.append("Bathroom")
+    if intent["filters"].get("category"):
+        context.append(intent["filters"]["category"])
     
     # Just return query as is for semantic search, heavily relying on embeddings
     return {
         "refined_query": query,
-        "detected_context": context
+        "detected_context": context,
+        "intent": intent
     }
 
-def search(query: str):
+def _to_results(hits):
+    results = []
+    for idx, score in hits:
+        item = items[idx]
+        results.append({
+            "item": item,
+            "score": float(score)
+        })
+    return results
+
+def _rerank(queries, hit_lists, top_k: int):
+    """Cross-encoder second stage; returns (hit lists, reranked flags)"""
+    candidate_lists = [[(items[idx]["id"], item_texts[idx], score) for idx, score in hits]
+                       for hits in hit_lists]
+    ranked, flags = reranker.rerank_batch(queries, candidate_lists, top_k)
+    position = {item["id"]: idx for idx, item in enumerate(items)}
+    return [[(position[item_id], score) for item_id, score in hits] for hits in ranked], flags
+
+def search(query: str, top_k: int = 3):
     """
     1. Analyze Intent
     2. Semantic Search
     """
-    analysis = analyze_intent_dummy(query)
-    refined_q = analysis["refined_query"]
+    return search_batch([query], top_k)[0]
+
+def _cached_responses(queries, keys):
+    """Cached {"analysis", "results"} per query (None on a miss); no intent work on a hit"""
+    if not RESULT_CACHE_ENABLED:
+        return [None] * len(queries)
+    responses = []
+    for query, key in zip(queries, keys):
+        cached = _result_cache.get(key)
+        if cached is not None:
+            # Normalization-equivalent queries share the entry; echo this query
+            cached = {**cached, "analysis": {**cached["analysis"], "refined_query": query}}
+        responses.append(cached)
+    return responses
+
+def search_batch(queries, top_k: int = 3):
+    """
+    Same as search() for many queries: cached responses are reused before
+    any intent work, the rest share one encode call and one matrix-matrix similarity.
+    """
+    load()
+    result_keys = [(MODEL_NAME, normalize_query(q), top_k) for q in queries]
+    responses = _cached_responses(queries, result_keys)
     
-    # Encode query
-    query_embedding = model.encode(refined_q, convert_to_tensor=True)
+    missing = [i for i, r in enumerate(responses) if r is None]
+    if missing:
+        analyses = [analyze_intent(queries[i]) for i in missing]
+        refined = [a["refined_query"] for a in analyses]
+        query_embeddings = encode_queries(refined)
+        # With a reranker, the first stage returns a wider candidate set
+        first_k = max(top_k, RERANK_CANDIDATES) if reranker is not None else top_k
+        if retriever is not None:
+            # Hybrid: BM25 and dense candidates fused per query
+            hit_lists = [retriever.retrieve(q, vec, first_k) for q, vec in zip(refined, query_embeddings)]
+        else:
+            # Compute cosine similarity
+            scores = query_embeddings @ np.asarray(item_embeddings).T
+            hit_lists = [[(idx, row[idx]) for idx in top_k_indices(row, first_k)] for row in scores]
+        cacheable = [True] * len(missing)
+        if reranker is not None:
+            # Budget overruns keep first-stage order; those aren't cached
+            hit_lists, cacheable = _rerank(refined, hit_lists, top_k)
+        for i, analysis, hits, ok in zip(missing, analyses, hit_lists, cacheable):
+            responses[i] = {"analysis": analysis, "results": _to_results(hits)}
+            if RESULT_CACHE_ENABLED and ok:
+                _result_cache.put(result_keys[i], responses[i])
     
-    # Compute cosine similarity
-    hits = util.semantic_search(query_embedding, item_embeddings, top_k=3)
+    return responses
+
+def search_multimodal(query: str, top_k: int = 3, image_weight: float = None):
+    """
+    Search the crawled catalog (products.db) with CLIP, scoring the query
+    against text and image embeddings in one pass. Same response shape as search().
+    """
+    return search_multimodal_batch([(query, image_weight)], top_k)[0]
+
+def search_multimodal_batch(requests, top_k: int = 3):
+    """
+    search_multimodal for many (query, image_weight) pairs: cached responses
+    are reused before any intent work, the rest share one CLIP encode and one similarity pass.
+    """
+    # Lazy import: CLIP is only loaded when a request opts in
+    import embeddings
+    queries = [query for query, _ in requests]
+    weights = [weight for _, weight in requests]
+    keys = [("multimodal", embeddings.MODEL_NAME, normalize_query(query), top_k, weight)
+            for query, weight in requests]
+    responses = _cached_responses(queries, keys)
     
-    # hits is a list of lists (one for each query)
-    top_hits = hits[0] 
+    missing = [i for i, r in enumerate(responses) if r is None]
+    if missing:
+        analyses = [analyze_intent(queries[i]) for i in missing]
+        hit_lists = embeddings.search_multimodal_batch(
+            [a["refined_query"] for a in analyses], top_k, [weights[i] for i in missing]
+        )
+        for i, analysis, hits in zip(missing, analyses, hit_lists):
+            responses[i] = {"analysis": analysis, "results": _catalog_results(hits)}
+            if RESULT_CACHE_ENABLED:
+                _result_cache.put(keys[i], responses[i])
     
+    return responses
+
+def search_by_image(data: bytes, top_k: int = 3, image_weight: float = None):
+    """
+    Search the crawled catalog with an uploaded photo (bounded decode,
+    one CLIP image encode). Raises upload_limits.InvalidUploadError for unusable uploads.
+    """
+    import embeddings
+    image = embeddings.decode_upload(data)
+    return {"results": _catalog_results(embeddings.search_by_image(image, top_k, image_weight))}
+
+def _catalog_results(hits):
+    """Map embeddings search hits to the kiosk result shape (zone as location)"""
     results = []
-    for hit in top_hits:
-        item = items[hit['corpus_id']]
+    for hit in hits:
         results.append({
-            "item": item,
-            "score": float(hit['score'])
+            "item": {
+                "id": hit["id"],
+                "name": hit["name"],
+                "category": hit["category_major"],
+                "price": hit["price"],
+                "location": inventory.get_zone_location(hit["category_major"]),
+            },
+            "score": hit["score"]
         })
-        
-    return {
-        "analysis": analysis,
-        "results": results
-    }
+    return results
 
 if __name__ == "__main__":
     # Test
@@ -4,6 +4,8 @@ Tests for database integrity, embeddings, and search performance
 """
 import sqlite3
 import os
+import shutil
+import tempfile
 import time
 import numpy as np
 
@@ -139,6 +141,38 @@ def test_search_performance():
     assert avg_time < 100, f"[FAIL] Expected < 100ms, got {avg_time:.1f}ms"
     print("    [PASS]")
 
+def test_fts_search():
+    """Test: FTS5 상품명 검색 < 100ms, 트리거 동기화 (DB 복사본에서 실행)"""
+    import database
+    
+    original_path = database.DB_PATH
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        database.DB_PATH = os.path.join(tmp_dir, 'products.db')
+        shutil.copy(DB_PATH, database.DB_PATH)
+        database.ensure_search_index()
+        
+        times = []
+        for query in ["물티슈", "컵", "화장지"]:
+            start = time.time()
+            results = database.search_products_fts(query, limit=10)
+            times.append((time.time() - start) * 1000)
+            assert all(query in r['name'] for r in results), f"[FAIL] Non-matching result for {query}"
+        
+        # Triggers keep the index in sync with products
+        database.insert_product(0, "테스트 전용 트라이그램 상품", 1000, "")
+        found = database.search_products_fts("트라이그램")
+        assert [r['name'] for r in found] == ["테스트 전용 트라이그램 상품"], f"[FAIL] Inserted row not indexed: {found}"
+        
+        avg_time = sum(times) / len(times)
+        print(f"[8] FTS Search: avg {avg_time:.1f}ms")
+        assert avg_time < 100, f"[FAIL] Expected < 100ms, got {avg_time:.1f}ms"
+        print("    [PASS]")
+    finally:
+        database.close_connections()
+        database.DB_PATH = original_path
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
 def run_all_tests():
     print("=" * 50)
     print("Database PoC Test")
@@ -182,6 +216,11 @@ def run_all_tests():
     except Exception as e:
         print(f"    [FAIL] {e}")
     
+    try:
+        test_fts_search()
+    except Exception as e:
+        print(f"    [FAIL] {e}")
+    
     print()
     print("=" * 50)
     print("Database PoC Test Complete")
@@ -0,0 +1,51 @@
+"""
+Reranker Test
+Tests for the cross-encoder latency budget (no model download: fake models)
+"""
+import time
+
+from reranker import CrossEncoderReranker
+
+CANDIDATES = [(1, "bath mat", 0.9), (2, "towel", 0.8), (3, "shower mat", 0.7)]
+
+class FakeCrossEncoder:
+    """Scores pairs by doc text length after sleeping `delay` seconds per predict"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=32):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [float(len(text)) for _, text in pairs]
+
+def test_rerank_within_budget():
+    """Test: 예산 안에서는 cross-encoder 순서"""
+    reranker = CrossEncoderReranker(budget_ms=1000, model=FakeCrossEncoder())
+    ranked, flags = reranker.rerank_batch(["mat"], [CANDIDATES], top_k=3)
+    
+    print(f"[1] Reranked: {ranked[0]}")
+    assert flags == [True]
+    assert [doc_id for doc_id, _ in ranked[0]] == [3, 1, 2]
+    assert reranker.stats()["fallbacks"] == 0
+    print("    [PASS]")
+
+def test_rerank_slow_predict_falls_back():
+    """Test: 예산을 넘긴 predict 결과는 버리고 1단계 순서 유지"""
+    model = FakeCrossEncoder(delay=0.3)
+    reranker = CrossEncoderReranker(budget_ms=50, model=model)
+    ranked, flags = reranker.rerank_batch(["mat"], [CANDIDATES], top_k=3)
+    
+    print(f"[2] Slow predict: {ranked[0]}, flags={flags}")
+    assert model.calls == 1
+    assert flags == [False]
+    assert ranked[0] == [(1, 0.9), (2, 0.8), (3, 0.7)]
+    assert reranker.stats()["fallbacks"] == 1
+    
+    # The late scores were cached, so the repeat query reranks without predicting
+    ranked, flags = reranker.rerank_batch(["mat"], [CANDIDATES], top_k=3)
+    assert model.calls == 1
+    assert flags == [True]
+    assert [doc_id for doc_id, _ in ranked[0]] == [3, 1, 2]
+    print("    [PASS]")
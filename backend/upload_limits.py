@@ -0,0 +1,12 @@
+"""
+Upload limits for Search-Roca photo queries
+Torch-free so the API layer can validate uploads without loading CLIP
+"""
+import os
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MAX_UPLOAD_PIXELS = int(os.getenv("MAX_UPLOAD_PIXELS", str(40_000_000)))
+
+
+class InvalidUploadError(ValueError):
+    """Uploaded photo is oversized or undecodable (a client error, not a server fault)"""
@@ -0,0 +1,174 @@
+"""
+Vector Index for Search-Roca
+Loaded-once, contiguous float32 embedding matrix with a parallel id array
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Row indices of the top_k highest scores, best first (argpartition + small sort)"""
+    n = scores.shape[0]
+    if top_k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k >= n:
+        return np.argsort(-scores, kind='stable')
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class EmbeddingIndex:
+    """
+    Exact inner-product index over L2-normalized vectors.
+    Rows of `matrix` line up with `ids`; a query is one matrix-vector product.
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, dim or 0), dtype=np.float32)
+        self._positions: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, ids, vectors) -> None:
+        """Insert or overwrite rows (incremental refresh)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(ids) != len(vectors):
+            raise ValueError(f"ids/vectors length mismatch: {len(ids)} vs {len(vectors)}")
+        if len(ids) == 0:
+            return
+        if self.dim is None or len(self) == 0:
+            self.dim = vectors.shape[1]
+            self.matrix = np.empty((0, self.dim), dtype=np.float32)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim} dims, got {vectors.shape[1]}")
+
+        new_ids, new_rows = [], []
+        for i, pid in enumerate(ids.tolist()):
+            pos = self._positions.get(pid)
+            if pos is None:
+                self._positions[pid] = len(self.ids) + len(new_ids)
+                new_ids.append(pid)
+                new_rows.append(i)
+            else:
+                self.matrix[pos] = vectors[i]
+
+        if new_ids:
+            self.ids = np.concatenate([self.ids, np.asarray(new_ids, dtype=np.int64)])
+            self.matrix = np.ascontiguousarray(np.vstack([self.matrix, vectors[new_rows]]))
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of one query against every row"""
+        return self.matrix @ np.asarray(query, dtype=np.float32).reshape(-1)
+
+    def search(self, query: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Return [(id, score), ...] best first"""
+        if len(self) == 0:
+            return []
+        scores = self.scores(query)
+        top = top_k_indices(scores, top_k)
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        """One matrix-matrix product for many queries"""
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(self) == 0:
+            return [[] for _ in range(len(queries))]
+        scores = queries @ self.matrix.T
+        results = []
+        for row in scores:
+            top = top_k_indices(row, top_k)
+            results.append([(int(self.ids[i]), float(row[i])) for i in top])
+        return results
+
+
+class MultimodalIndex:
+    """
+    Text and image embeddings of the same items, fused as
+    (1 - w) * text + w * image. The text side is the shared `base` matrix,
+    scored in place (no copy); the image side is a separate matrix aligned
+    to the base rows by rebuild(), once per refresh. Items without an image
+    embedding use their text score on the image side.
+    """
+
+    def __init__(self, image_weight: float = 0.3, base: EmbeddingIndex = None):
+        self.image_weight = image_weight
+        self.base = base if base is not None else EmbeddingIndex()
+        self._image = EmbeddingIndex()
+        self._has_image: Dict[int, bool] = {}
+        self.ids = np.empty(0, dtype=np.int64)
+        self.text = np.empty((0, 0), dtype=np.float32)
+        self.images = np.empty((0, 0), dtype=np.float32)
+        self.image_mask = np.empty(0, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, ids, text_vectors, image_vectors) -> None:
+        """Insert/overwrite rows in the base index with their images, then rebuild"""
+        self.base.add(ids, text_vectors)
+        self.set_images(ids, image_vectors)
+        self.rebuild()
+
+    def set_images(self, ids, image_vectors) -> None:
+        """Record image vectors (entries may be None) for rows of the base index"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(ids) == 0:
+            return
+        zeros = np.zeros(self.base.dim, dtype=np.float32)
+        self._image.add(ids, np.stack([zeros if v is None else np.asarray(v, dtype=np.float32).reshape(-1)
+                                       for v in image_vectors]))
+        for pid, vec in zip(ids.tolist(), image_vectors):
+            self._has_image[pid] = vec is not None
+
+    def rebuild(self) -> None:
+        """Align the image rows to the base row order (the text matrix is referenced, not copied)"""
+        ids, text = self.base.ids, self.base.matrix
+        images = self._image.matrix
+        if not np.array_equal(self._image.ids, ids):
+            position = {pid: i for i, pid in enumerate(self._image.ids.tolist())}
+            images = np.ascontiguousarray(images[[position[pid] for pid in ids.tolist()]])
+        self.ids = ids
+        self.text = text
+        self.images = images
+        self.image_mask = np.array([self._has_image[pid] for pid in ids.tolist()], dtype=bool)
+
+    def fused_scores(self, query: np.ndarray, image_weight: float = None) -> np.ndarray:
+        """Fused text/image cosine similarity against every row"""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        return self._fuse(self.text @ query, self.images @ query, image_weight)
+
+    def _fuse(self, text_scores: np.ndarray, image_scores: np.ndarray, image_weight: float = None) -> np.ndarray:
+        weight = self.image_weight if image_weight is None else image_weight
+        image_scores = np.where(self.image_mask, image_scores, text_scores)
+        return (1.0 - weight) * text_scores + weight * image_scores
+
+    def search(self, query: np.ndarray, top_k: int = 5, image_weight: float = None) -> List[Tuple[int, float]]:
+        """Return [(id, fused_score), ...] best first"""
+        if len(self) == 0:
+            return []
+        scores = self.fused_scores(query, image_weight)
+        top = top_k_indices(scores, top_k)
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 5,
+                     image_weights=None) -> List[List[Tuple[int, float]]]:
+        """Two matrix-matrix products for many queries; `image_weights` is one weight (or None) per query"""
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(self) == 0:
+            return [[] for _ in range(len(queries))]
+        image_weights = image_weights if image_weights is not None else [None] * len(queries)
+        text_scores = queries @ self.text.T
+        image_scores = queries @ self.images.T
+        results = []
+        for text_row, image_row, weight in zip(text_scores, image_scores, image_weights):
+            fused = self._fuse(text_row, image_row, weight)
+            top = top_k_indices(fused, top_k)
+            results.append([(int(self.ids[i]), float(fused[i])) for i in top])
+        return results
@@ -0,0 +1,228 @@
+"""
+Concurrent evaluation runner for the PoC golden test suites
+- fans cases out on asyncio with a concurrency limit (EVAL_CONCURRENCY)
+- token-bucket rate limiter for LLM quotas (EVAL_RATE_PER_SEC, EVAL_BURST):
+  one token per LLM backend request, installed on the shared client
+- per-case results checkpointed to JSONL; an interrupted run resumes
+  from the checkpoint (EVAL_FRESH=1 starts over), re-running cases that
+  raised or fell back. The header line records the LLM backend/model and a
+  prompt hash; a checkpoint written with different ones is discarded
+- accuracy plus p50/p95 latency per stage
+
+`evaluate_case(case, timer)` is a plain (blocking) function run on a worker
+thread; wrap each stage in `with timer.stage("name"):` and return a dict
+with "is_pass" (True/False, or None when the case isn't graded) and
+"fallback": True when an LLM stage failed and a fallback answer was graded.
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), "cache")
+
+
+class TokenBucket:
+    """`rate` tokens per second, bursts up to `capacity`; acquire() blocks (called from worker threads)"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                time.sleep((1 - self._tokens) / self.rate)
+
+
+class StageTimer:
+    """Wall-clock milliseconds per named stage of one case"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def run_header(llm=None, prompts=()) -> dict:
+    """What the checkpointed answers depend on: LLM backend/model and the prompts"""
+    digest = hashlib.sha256()
+    for prompt in prompts:
+        # Prompts built inline (f-strings) are hashed through their function's source
+        text = prompt if isinstance(prompt, str) else inspect.getsource(prompt)
+        digest.update(text.encode("utf-8") + b"\x00")
+    return {
+        "backend": getattr(llm, "backend_name", None),
+        "model": getattr(llm, "model_name", None),
+        "prompt_hash": digest.hexdigest()[:16],
+    }
+
+
+def read_header(path: str) -> Optional[dict]:
+    """Header of an existing checkpoint (None if missing or written before headers)"""
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            return json.loads(f.readline()).get("header")
+        except (ValueError, AttributeError):
+            return None
+
+
+def load_checkpoint(path: str) -> Dict[str, dict]:
+    """Completed (no error, no fallback) records by case key; a torn last line is ignored"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "key" in record and "error" not in record and not record.get("fallback"):
+                done[record["key"]] = record
+    return done
+
+
+async def run_eval_async(cases: List[dict], evaluate_case: Callable, checkpoint_path: str,
+                         concurrency: int = 4, rate_per_sec: Optional[float] = None,
+                         burst: Optional[float] = None, case_key: Callable = None,
+                         fresh: bool = False, llm=None, prompts=()) -> List[dict]:
+    """
+    Evaluate every case (skipping checkpointed ones); returns records in case order.
+    `llm` is the shared LLMClient the cases call (rate limited per request,
+    recorded in the header with the `prompts` hash).
+    """
+    # Default key: the case id, else position + query (stable across reruns)
+    case_key = case_key or (lambda i, case: str(case["id"]) if case.get("id") is not None
+                            else f"{i}:{case.get('query', '')}")
+    keys = [case_key(i, case) for i, case in enumerate(cases)]
+    duplicates = sorted(key for key, count in Counter(keys).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Duplicate case keys (records would overwrite each other): {duplicates[:10]}")
+
+    if rate_per_sec and llm is None:
+        raise ValueError("rate_per_sec needs the shared LLM client (llm=...) to limit its requests")
+
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+    header = run_header(llm, prompts)
+    if not fresh and os.path.exists(checkpoint_path) and read_header(checkpoint_path) != header:
+        print(f"🗑️ {checkpoint_path} was written with another LLM backend/model/prompt: starting over")
+        fresh = True
+    if fresh and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    done = load_checkpoint(checkpoint_path)
+    if done:
+        print(f"♻️ Resuming: {sum(k in done for k in keys)}/{len(cases)} cases already in {checkpoint_path}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    new_file = not os.path.exists(checkpoint_path)
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8")
+    if new_file:
+        checkpoint.write(json.dumps({"header": header}) + "\n")
+    if rate_per_sec:
+        # Quotas count requests, not cases (a case may call the LLM several times)
+        previous_limiter = llm.rate_limiter
+        llm.rate_limiter = TokenBucket(rate_per_sec, burst).acquire
+
+    async def run_one(key: str, case: dict) -> dict:
+        async with semaphore:
+            timer = StageTimer()
+            start = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(evaluate_case, case, timer)
+                record = {"key": key, **result}
+            except Exception as e:
+                record = {"key": key, "is_pass": False, "error": str(e)}
+            record["stage_ms"] = timer.stages
+            record["total_ms"] = (time.perf_counter() - start) * 1000
+            # Single event-loop thread: whole lines, no interleaving
+            checkpoint.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            checkpoint.flush()
+            return record
+
+    try:
+        pending = [run_one(key, case) for key, case in zip(keys, cases) if key not in done]
+        fresh_records = {r["key"]: r for r in await asyncio.gather(*pending)}
+    finally:
+        checkpoint.close()
+        if rate_per_sec:
+            llm.rate_limiter = previous_limiter
+    return [done.get(key) or fresh_records[key] for key in keys]
+
+
+def run_eval(cases: List[dict], evaluate_case: Callable, name: str, **kwargs) -> List[dict]:
+    """
+    Sync entry point configured from EVAL_* env vars; the checkpoint is
+    cache/eval_<name>.jsonl next to this file. Pass `llm` and `prompts`
+    (strings or the functions building them) as for run_eval_async.
+    """
+    options = dict(
+        checkpoint_path=os.path.join(CHECKPOINT_DIR, f"eval_{name}.jsonl"),
+        concurrency=int(os.getenv("EVAL_CONCURRENCY", "4")),
+        rate_per_sec=float(os.getenv("EVAL_RATE_PER_SEC", "0")) or None,
+        burst=float(os.getenv("EVAL_BURST", "0")) or None,
+        fresh=os.getenv("EVAL_FRESH", "0") == "1",
+    )
+    options.update(kwargs)
+    start = time.time()
+    records = asyncio.run(run_eval_async(cases, evaluate_case, **options))
+    print_summary(records, time.time() - start)
+    return records
+
+
+def summarize(records: List[dict]) -> dict:
+    """Accuracy over graded cases plus p50/p95 latency (ms) per stage and in total"""
+    graded = [r for r in records if r.get("is_pass") is not None]
+    passed = sum(1 for r in graded if r["is_pass"])
+    stage_names = sorted({s for r in records for s in r.get("stage_ms", {})})
+    latency = {}
+    for stage in stage_names + ["total"]:
+        values = [r["total_ms"] if stage == "total" else r["stage_ms"][stage]
+                  for r in records if stage == "total" or stage in r.get("stage_ms", {})]
+        if values:
+            latency[stage] = {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95))}
+    return {
+        "cases": len(records),
+        "graded": len(graded),
+        "passed": passed,
+        "errors": sum(1 for r in records if "error" in r),
+        "fallbacks": sum(1 for r in records if r.get("fallback")),
+        "accuracy": passed / len(graded) * 100 if graded else 0.0,
+        "latency_ms": latency,
+    }
+
+
+def print_summary(records: List[dict], duration: float = None) -> dict:
+    summary = summarize(records)
+    print("-" * 60)
+    if duration is not None:
+        print(f"🏁 {summary['cases']} cases in {duration:.2f}s "
+              f"({summary['errors']} errors, {summary['fallbacks']} LLM fallbacks)")
+    print(f"📊 Accuracy: {summary['passed']}/{summary['graded']} ({summary['accuracy']:.1f}%)")
+    print(f"⏱️ Latency (ms)   {'p50':>10} {'p95':>10}")
+    for stage, values in summary["latency_ms"].items():
+        print(f"   {stage:<14} {values['p50']:>10.1f} {values['p95']:>10.1f}")
+    return summary
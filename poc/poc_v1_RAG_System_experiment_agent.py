@@ -1,24 +1,30 @@
 
 import os
+import sys
 import json
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-import google.generativeai as genai
 import time
 
+# Backend modules (category-partitioned vector index, LLM client)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from category_index import CategoryPartitionedIndex
+from llm_client import LLMError, get_client
+
 # ==========================================
 # ⚙️ Configuration & Setup
 # ==========================================
 # Load backend .env
+# (LLM_BACKEND=stub runs the agent offline; see backend/llm_client.py)
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", "backend", ".env"))
-api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-if api_key: genai.configure(api_key=api_key)
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "products_large.json")
 TEST_INPUT_PATH = os.path.join(os.path.dirname(__file__), "data", "rag_e2e_test_queries.json")
 
 LOCAL_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+# Below this many products in the intent category, search the whole catalog
+MIN_CATEGORY_CANDIDATES = 5
 _model_instance = None
 
 def get_model():
@@ -49,8 +55,6 @@ def run_meaning_extraction_agent(sentence):
     Input: "설거지할 때 끼는 고무장갑 추천해줘"
     Output: {"keyword": "고무장갑", "intent": "주방", "attributes": ["설거지용"]}
     """
-    if not api_key: return None
-    
     prompt = f"""
     You are a Search Query Refiner Agent.
     
@@ -72,15 +76,11 @@ def run_meaning_extraction_agent(sentence):
     """
     
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        import re
-        match = re.search(r'\{.*\}', response.text, re.DOTALL)
-        if match:
-            return json.loads(match.group(0))
-    except Exception as e:
+        extracted = get_client().generate_json(prompt)
+    except LLMError as e:
         print(f"Agent Error: {e}")
-    return None
+        return None
+    return extracted if isinstance(extracted, dict) else None
 
 def vector_search(query, products, top_k=10):
     q_vec = get_embedding(query)
@@ -94,8 +94,21 @@ def vector_search(query, products, top_k=10):
     scored.sort(key=lambda x: x["score"], reverse=True)
     return scored[:top_k]
 
+def build_category_index(products):
+    """Embed every product once (batched) and partition the matrix by category"""
+    texts = [f"{p['name']} {p['desc']} {p['category']}" for p in products]
+    vectors = get_model().encode(texts, batch_size=64, normalize_embeddings=True)
+    index = CategoryPartitionedIndex(min_candidates=MIN_CATEGORY_CANDIDATES)
+    index.add([p['id'] for p in products], vectors, [p['category'] for p in products])
+    return index
+
+def category_search(index, products_by_id, query, top_k=10, category=None):
+    """Filtered query = one slice of the category block (global fallback if too small)"""
+    q_vec = get_model().encode(query, normalize_embeddings=True)
+    hits = index.search(q_vec, top_k, major=category)
+    return [{**products_by_id[pid], "score": score} for pid, score in hits]
+
 def rerank_results(query, candidates):
-    if not api_key: return []
     cand_text = "\n".join([f"ID {c['id']}: {c['name']} ({c['desc']})" for c in candidates])
     
     prompt = f"""
@@ -107,15 +120,11 @@ def rerank_results(query, candidates):
     Filter out homonyms (e.g. Yoga Mat vs Bath Mat).
     """
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        import re
-        match = re.search(r'\[.*\]', response.text, re.DOTALL)
-        if match:
-            return json.loads(match.group(0))
-    except:
-        pass
-    return []
+        ranked = get_client().generate_json(prompt)
+    except LLMError as e:
+        print(f"Rerank Error: {e}")
+        return []
+    return ranked if isinstance(ranked, list) else []
 
 # ==========================================
 # 🧪 Validation Suite
@@ -127,6 +136,10 @@ def run_simulation():
     test_inputs = load_json(TEST_INPUT_PATH)
     print(f"✅ Loaded {len(products)} products, {len(test_inputs)} sentences.")
     
+    # Embed once, partitioned by category (no per-query list scans)
+    index = build_category_index(products)
+    products_by_id = {p['id']: p for p in products}
+    
     # We will compare K=30 (Proposed)
     K_VAL = 30
     
@@ -157,14 +170,11 @@ def run_simulation():
         if is_intent_correct: stats["agent_success"] += 1
         
         # 2. Retrieval with Extracted Metadata
-        # Filter scope by Agent Intent (Rule: Pre-filter)
-        if is_intent_correct:
-            scope = [p for p in products if p['category'] == agent_intent]
-        else:
-            scope = products # Fallback
+        # Filter scope by Agent Intent (Rule: Pre-filter), global index as fallback
+        category = agent_intent if is_intent_correct else None
             
         # Search using Agent Keyword (not raw sentence)
-        retrieved = vector_search(agent_kw, scope, top_k=K_VAL)
+        retrieved = category_search(index, products_by_id, agent_kw, top_k=K_VAL, category=category)
         
         # 3. Check Recall
         hit = any(target_kw in r['name'] for r in retrieved)
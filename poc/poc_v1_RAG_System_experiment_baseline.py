@@ -3,15 +3,17 @@ import json
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-import google.generativeai as genai
+import sys
 import time
 
 # ==========================================
 # ⚙️ Configuration & Setup
 # ==========================================
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", "backend", ".env"))
-api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-if api_key: genai.configure(api_key=api_key)
+
+# Backend LLM client (disk cache, timeout/retry; LLM_BACKEND=stub runs offline)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from llm_client import LLMError, get_client
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "products_large.json")
 # [Differences vs Keyword Script]
@@ -45,7 +47,6 @@ def cosine_similarity(v1, v2):
 
 def classify_intent(query, categories):
     """[Issue 3] Intent Classifier (Basic - No extra rules for Baseline)"""
-    if not api_key: return "Error"
     
     cat_list_str = ", ".join(categories)
     prompt = f"""
@@ -59,14 +60,12 @@ def classify_intent(query, categories):
     3. If unsure, pick the closest one.
     """
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        pred = response.text.strip()
-        for c in categories:
-            if c in pred: return c
-        return pred
-    except:
+        pred = get_client().generate(prompt).strip()
+    except LLMError:
         return "Error"
+    for c in categories:
+        if c in pred: return c
+    return pred
 
 def vector_search(query, products, top_k=10):
     """[Issue 1] Vector Search"""
@@ -86,8 +85,6 @@ def vector_search(query, products, top_k=10):
 
 def rerank_results(query, candidates):
     """[Issue 2] LLM Reranker"""
-    if not api_key: return []
-    
     cand_text = "\n".join([f"ID {c['id']}: {c['name']} ({c['desc']})" for c in candidates])
     
     prompt = f"""
@@ -101,15 +98,11 @@ def rerank_results(query, candidates):
     3. Return JSON list: [{{"id": 123, "rank": 1}}, ...]
     """
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        import re
-        match = re.search(r'\[.*\]', response.text, re.DOTALL)
-        if match:
-            return json.loads(match.group(0))
-    except Exception as e:
+        ranked = get_client().generate_json(prompt)
+    except LLMError as e:
         print(f"Rerank Error: {e}")
-    return []
+        return []
+    return ranked if isinstance(ranked, list) else []
 
 # ==========================================
 # 🧪 Validation Suite
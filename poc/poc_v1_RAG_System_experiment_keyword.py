@@ -4,15 +4,17 @@ import json
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-import google.generativeai as genai
+import sys
 import time
 
 # ==========================================
 # ⚙️ Configuration & Setup
 # ==========================================
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", "backend", ".env"))
-api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-if api_key: genai.configure(api_key=api_key)
+
+# Backend LLM client (disk cache, timeout/retry; LLM_BACKEND=stub runs offline)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from llm_client import LLMError, get_client
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "products_large.json")
 TEST_INPUT_PATH = os.path.join(os.path.dirname(__file__), "data", "rag_test_keywords.json")
@@ -49,23 +51,19 @@ def load_prompt(filename):
 
 def classify_intent(query, categories):
     """[Issue 3] Intent Classifier (Loaded from prompts/intent_rules_prompt.txt)"""
-    if not api_key: return "Error"
     
     cat_list_str = ", ".join(categories)
     try:
         prompt_template = load_prompt("intent_rules_prompt.txt")
         prompt = prompt_template.replace("{query}", query).replace("{cat_list_str}", cat_list_str)
-        
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        pred = response.text.strip()
-        # Cleanup
-        for c in categories:
-            if c in pred: return c
-        return pred
-    except Exception as e:
+        pred = get_client().generate(prompt).strip()
+    except (OSError, LLMError) as e:
         print(f"Intent Error: {e}")
         return "Error"
+    # Cleanup
+    for c in categories:
+        if c in pred: return c
+    return pred
 
 def vector_search(query, products, top_k=10):
     """[Issue 1] Vector Search"""
@@ -87,24 +85,21 @@ def vector_search(query, products, top_k=10):
 
 def rerank_results(query, candidates):
     """[Issue 2] LLM Reranker (Loaded from prompts/rerank_prompt.txt)"""
-    if not api_key: return []
-    
     cand_text = "\n".join([f"ID {c['id']}: {c['name']} ({c['desc']})" for c in candidates])
     
     try:
         prompt_template = load_prompt("rerank_prompt.txt")
         # Use simple replace to avoid f-string complexity with json braces in txt
         prompt = prompt_template.replace("{query}", query).replace("{candidate_text}", cand_text)
-        
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        import re
-        match = re.search(r'\[.*\]', response.text, re.DOTALL)
-        if match:
-            return json.loads(match.group(0))
-    except Exception as e:
+    except OSError as e:
+        print(f"Rerank Error: {e}")
+        return []
+    try:
+        ranked = get_client().generate_json(prompt)
+    except LLMError as e:
         print(f"Rerank Error: {e}")
-    return []
+        return []
+    return ranked if isinstance(ranked, list) else []
 
 def run_simulation():
     print("📦 Loading Data...")
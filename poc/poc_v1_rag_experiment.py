@@ -1,13 +1,16 @@
 import os
-import json
-import numpy as np
-import os
+import sys
 import json
 import numpy as np
 # import google.generativeai as genai  <-- [Mod] Lazy import로 변경
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 
+# Backend modules (category-partitioned vector index, LLM client)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from category_index import CategoryPartitionedIndex
+from llm_client import LLMError, get_client
+
 # 로컬 환경 변수 로드 (.env 파일이 있다면)
 # 1. 현재 폴더(poc) 확인
 # 2. 형제 폴더(backend) 확인
@@ -29,6 +32,8 @@ else:
 # 다국어(한국어 포함) 성능이 우수한 경량화 모델
 LOCAL_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
 _local_model_instance = None # Lazy Loading
+# Below this many products in the predicted category, search the whole catalog
+MIN_CATEGORY_CANDIDATES = 3
 
 # 데이터 경로
 DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "products.json")
@@ -237,14 +242,6 @@ def experiment_llm_reranking(products):
     # 2. LLM에게 Re-ranking 요청
     print("\n2️⃣ Gemini에게 Re-ranking 요청 중...")
     
-    # Lazy Import & Config
-    import google.generativeai as genai
-    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        print("❌ GOOGLE_API_KEY가 없어서 Skip합니다.")
-        return
-    genai.configure(api_key=api_key)
-    
     # Prompt 구성
     candidate_text = ""
     for i, item in enumerate(candidates):
@@ -269,42 +266,29 @@ def experiment_llm_reranking(products):
     ]
     """
     
+    # 공용 LLM 클라이언트 (JSON 파싱/캐시/타임아웃, LLM_BACKEND=stub이면 오프라인)
     try:
-        # gemini-2.0-flash (Verified Available)
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        
-        # JSON 파싱 (간단한 처리)
-        import re
-        json_match = re.search(r'\[.*\]', response.text, re.DOTALL)
-        if json_match:
-            rerank_results = json.loads(json_match.group(0))
-            
-            print("\n🎉 [After Re-ranking] 최종 결과:")
-            for item in rerank_results:
-                # 원래 상품 정보 매핑
-                original_prod = next((p for p in candidates if p['id'] == item['id']), None)
-                if original_prod:
-                    mark = "✅" if item['id'] in {1, 5, 9} else "  "
-                    print(f" - {mark} Rank {item['rank']}: {original_prod['name']} (Reason: {item.get('reason', '')})")
-                    
-        else:
-            print(f"❌ JSON 파싱 실패. 응답 원본:\n{response.text}")
-            
-    except Exception as e:
+        rerank_results = get_client().generate_json(prompt)
+    except LLMError as e:
         print(f"❌ Re-ranking 중 에러 발생: {e}")
+        return
+    if not isinstance(rerank_results, list):
+        print(f"❌ JSON 형식 오류 (리스트 아님): {rerank_results}")
+        return
+    
+    print("\n🎉 [After Re-ranking] 최종 결과:")
+    for item in rerank_results:
+        # 원래 상품 정보 매핑
+        original_prod = next((p for p in candidates if p['id'] == item.get('id')), None)
+        if original_prod:
+            mark = "✅" if item['id'] in {1, 5, 9} else "  "
+            print(f" - {mark} Rank {item.get('rank')}: {original_prod['name']} (Reason: {item.get('reason', '')})")
 
 def classify_intent(query, categories):
     """
     [Intent Classifier]
     사용자의 검색어(Query)를 보고 가장 적절한 카테고리를 예측합니다.
     """
-    # Lazy Import & Config
-    import google.generativeai as genai
-    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-    if not api_key: return None
-    genai.configure(api_key=api_key)
-    
     cat_list_str = ", ".join(categories)
     
     prompt = f"""
@@ -320,20 +304,18 @@ def classify_intent(query, categories):
     3. 목록에 없는 경우 가장 가까운 것을 선택하거나, 모르면 '기타'라고 하세요.
     """
     
+    # 공용 LLM 클라이언트 (캐시/타임아웃/재시도, LLM_BACKEND=stub이면 오프라인)
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        predicted_category = response.text.strip()
-        
-        # 후처리: 이상한 문장 부호 제거나 매칭 확인
-        for cat in categories:
-            if cat in predicted_category:
-                return cat
-        return predicted_category
-        
-    except Exception as e:
+        predicted_category = get_client().generate(prompt).strip()
+    except LLMError as e:
         print(f"❌ Intent Classification Error: {e}")
         return None
+    
+    # 후처리: 이상한 문장 부호 제거나 매칭 확인
+    for cat in categories:
+        if cat in predicted_category:
+            return cat
+    return predicted_category
 
 def experiment_category_filter(products):
     """
@@ -349,6 +331,14 @@ def experiment_category_filter(products):
     all_categories = set(p['category'] for p in products)
     print(f"📋 감지된 카테고리 목록: {all_categories}")
     
+    # 상품 임베딩은 한 번만 (배치) 계산하고, 카테고리별 연속 블록으로 분할
+    texts = [f"{p['name']} {p['desc']} {p['category']}" for p in products]
+    get_local_embedding("")  # 모델 로딩
+    vectors = _local_model_instance.encode(texts, batch_size=64, normalize_embeddings=True)
+    index = CategoryPartitionedIndex(min_candidates=MIN_CATEGORY_CANDIDATES)
+    index.add([p['id'] for p in products], vectors, [p['category'] for p in products])
+    products_by_id = {p['id']: p for p in products}
+    
     # 2. 다중 테스트 케이스
     test_queries = [
         "욕실매트",         # Exp: 욕실
@@ -367,20 +357,20 @@ def experiment_category_filter(products):
             
         print(f"👉 AI 판단 카테고리: '{predicted}'")
         
-        # (2) 필터링
-        filtered_products = [p for p in products if p['category'] == predicted]
-        print(f"👉 필터링 결과: {len(products)}개 -> {len(filtered_products)}개")
-        
-        if not filtered_products:
-            print("❌ 해당 카테고리 상품 없음.")
-            continue
+        # (2) 필터링: 카테고리 블록 슬라이스 (후보가 부족하면 전체 인덱스로 Fallback)
+        block_size = sum(end - start for start, end in index.partition(major=predicted))
+        print(f"👉 필터링 결과: {len(products)}개 -> {block_size}개")
 
         # (3) 검색 수행 (Local Model)
-        results = vector_search(query, filtered_products, top_k=3, threshold=0.0, use_local_model=True)
+        query_vec = _local_model_instance.encode(query, normalize_embeddings=True)
+        hits, scope = index.search_scoped(query_vec, top_k=3, major=predicted)
+        if scope == "global":
+            print("⚠️ 해당 카테고리 후보 부족 -> 전체 상품에서 검색")
         
         print("🔎 Top-3 검색 결과:")
-        for i, item in enumerate(results):
-            print(f" - #{i+1}: {item['name']} (Category: {item['category']}, Score: {item['score']:.4f})")
+        for i, (pid, score) in enumerate(hits):
+            item = products_by_id[pid]
+            print(f" - #{i+1}: {item['name']} (Category: {item['category']}, Score: {score:.4f})")
 
 
 # ==========================================
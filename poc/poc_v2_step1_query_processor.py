@@ -1,14 +1,16 @@
 
 import os
+import sys
 import json
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 # Setup
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", "backend", ".env"))
-api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-2.0-flash')
+# Backend LLM client (disk cache, timeout/retry, JSON parsing; LLM_BACKEND=stub runs offline) and intent fast path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from llm_client import get_client
+from intent import IntentExtractor
+llm = get_client()
 
 def load_prompt(filename):
     # For now, we will define prompt inline or use a template file if we were fully structured.
@@ -42,23 +44,18 @@ Output JSON Format:
 }}
 """
 
+def llm_process_query(query):
+    # Raises on failure: the extractor then falls back to the rule intent and caches nothing
+    prompt = INTENT_PROMPT.replace("{query}", query)
+    return llm.generate_json(prompt)
+
+# Rule fast path (category/price/sort) first; the LLM only for low-confidence queries
+# (on by default here, unlike the backend: the LLM fallback is what this PoC measures)
+intent_extractor = IntentExtractor.from_env(llm_extract=llm_process_query, name="poc_v2_step1",
+                                            llm_enabled=os.getenv("INTENT_LLM_ENABLED", "1") == "1")
+
 def process_query(query):
-    try:
-        prompt = INTENT_PROMPT.replace("{query}", query)
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        if text.startswith("```json"): text = text[7:]
-        if text.endswith("```"): text = text[:-3]
-        return json.loads(text)
-    except Exception as e:
-        print(f"Error processing query '{query}': {e}")
-        return {
-            "is_search_intent": True,
-            "keywords": query.split(), # fallback
-            "filters": {},
-            "sort": "relevance",
-            "needs_expansion": []
-        }
+    return intent_extractor.extract(query)
 
 def run_test_cases():
     test_file = os.path.join(os.path.dirname(__file__), "data", "poc_v2_golden_test_cases.json")
@@ -99,6 +96,7 @@ def run_test_cases():
              score += 1 # Assume correct for now if no rigid expectation
 
     print(f"\n📊 Final Accuracy: {score}/{total}")
+    print(f"⚡ Intent fast path: {intent_extractor.stats()}")
 
 if __name__ == "__main__":
     # If run directly without arguments, run validation
@@ -1,13 +1,19 @@
 
 import os
+import sys
 import json
 import time
+import hashlib
 import numpy as np
-from rank_bm25 import BM25Okapi
 from sentence_transformers import SentenceTransformer
 import warnings
 from tqdm import tqdm
 
+# Backend modules (inverted BM25 index, Korean tokenizer)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from bm25_index import BM25Index
+from korean_tokenizer import TokenCache, TOKENIZER_VERSION, korean_tokenize
+
 warnings.filterwarnings("ignore")
 
 # ===========================
@@ -15,6 +21,8 @@ warnings.filterwarnings("ignore")
 # ===========================
 DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "poc_v2_mock_product_db.json")
 TEST_CASES_PATH = os.path.join(os.path.dirname(__file__), "data", "poc_v2_golden_test_cases.json")
+BM25_INDEX_PATH = os.path.join(os.path.dirname(__file__), "cache", "poc_v2_bm25_index.json")
+TOKEN_CACHE_PATH = os.path.join(os.path.dirname(__file__), "cache", "poc_v2_tokens.json")
 LOCAL_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
 
 class SearchEngine:
@@ -24,7 +32,7 @@ class SearchEngine:
         self.bm25 = None
         self.vector_model = None
         self.product_embeddings = None
-        self.corpus_tokenized = []
+        self.product_token_sets = []
         
         self._load_data()
         self._build_indices()
@@ -37,11 +45,16 @@ class SearchEngine:
         print(f"📦 Loaded {len(self.products)} products.")
 
     def _build_indices(self):
-        # 1. BM25 Index
-        print("📝 Building BM25 Index...")
-        # Tokenize simply by whitespace for this PoC (Korean specific tokenization would be better but keeping simple)
-        self.corpus_tokenized = [self.tokenize(f"{p['name']} {p.get('searchable_desc','')} {p['category_middle']}") for p in self.products]
-        self.bm25 = BM25Okapi(self.corpus_tokenized)
+        # 1. BM25 Index (inverted index, loaded from disk unless the catalog changed)
+        print("📝 Loading BM25 Index...")
+        # Korean-aware tokens (particles stripped + syllable bigrams), cached per product text
+        token_cache = TokenCache(TOKEN_CACHE_PATH)
+        bm25_texts = [f"{p['name']} {p.get('searchable_desc','')} {p['category_middle']}" for p in self.products]
+        fingerprint = hashlib.sha256("\x00".join([f"v{TOKENIZER_VERSION}"] + bm25_texts).encode("utf-8")).hexdigest()
+        self.bm25 = BM25Index.load_or_build(BM25_INDEX_PATH, bm25_texts, tokenizer=korean_tokenize,
+                                            fingerprint=fingerprint, token_cache=token_cache)
+        term_texts = [p['name'] + " " + p.get('searchable_desc', '') for p in self.products]
+        self.product_token_sets = [set(tokens) for tokens in token_cache.tokenize_many(term_texts)]
         
         # 2. Vector Index
         print(f"🧠 Loading Vector Model ({LOCAL_MODEL_NAME})...")
@@ -50,31 +63,27 @@ class SearchEngine:
         texts = [f"{p['name']} {p['category_middle']} {p.get('desc','')} {p.get('searchable_desc','')}" for p in self.products]
         self.product_embeddings = self.vector_model.encode(texts, show_progress_bar=True)
         
-    def tokenize(self, text):
-        return text.lower().split()
+    @staticmethod
+    def tokenize(text):
+        return korean_tokenize(text)
 
     # ===========================
     # Search Methods
     # ===========================
     
     def search_term_match(self, query, top_k=20):
-        # Simple scorer: count overlapping tokens
+        # Simple scorer: count overlapping tokens (product tokens precomputed)
         q_tokens = set(self.tokenize(query))
-        scores = []
-        for p in self.products:
-            p_text = (p['name'] + " " + p.get('searchable_desc', '')).lower()
-            score = sum(1 for t in q_tokens if t in p_text)
-            scores.append(score)
+        scores = [len(q_tokens & p_tokens) for p_tokens in self.product_token_sets]
         
         # Sort
         top_indices = np.argsort(scores)[::-1][:top_k]
         return [self.products[i] for i in top_indices if scores[i] > 0]
 
     def search_bm25(self, query, top_k=20):
-        tokenized_query = self.tokenize(query)
-        scores = self.bm25.get_scores(tokenized_query)
-        top_indices = np.argsort(scores)[::-1][:top_k]
-        return [self.products[i] for i in top_indices]
+        # Only documents sharing a term with the query are scored; top-k via heap
+        hits = self.bm25.search(query, top_k=top_k)
+        return [self.products[i] for i, _ in hits]
 
     def search_vector(self, query, top_k=20):
         q_vec = self.vector_model.encode([query])[0]
@@ -91,8 +100,7 @@ class SearchEngine:
         # RRF or Weighted Sum? Let's use Weighted Sum of normalized scores for simplicity
         
         # BM25 Scores
-        tokenized_query = self.tokenize(query)
-        bm25_scores = self.bm25.get_scores(tokenized_query)
+        bm25_scores = np.array(self.bm25.get_scores(query))
         if bm25_scores.max() > 0:
             bm25_scores = bm25_scores / bm25_scores.max() # Normalize 0-1
             
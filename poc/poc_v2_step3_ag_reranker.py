@@ -1,17 +1,21 @@
 
 import os
+import sys
 import json
 import time
-import google.generativeai as genai
 from sentence_transformers import CrossEncoder
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+# Backend modules (batched, cached cross-encoder reranker; LLM client)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from reranker import CrossEncoderReranker
+
 # Setup
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", "backend", ".env"))
-api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-2.0-flash')
+from llm_client import get_client
+llm = get_client()
+from eval_runner import run_eval
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "poc_v2_mock_product_db.json")
 TEST_CASES_PATH = os.path.join(os.path.dirname(__file__), "data", "poc_v2_golden_test_cases.json")
@@ -38,21 +42,18 @@ except Exception as e:
     print(f"Error loading CrossEncoder: {e}")
     ce_model = None
 
+# Batched predict + pair-score cache; no latency budget for offline evaluation
+ce_reranker = CrossEncoderReranker('cross-encoder/ms-marco-MiniLM-L-6-v2', budget_ms=None, model=ce_model) if ce_model else None
+
 def rerank_cross_encoder(query, candidates, top_k=5):
-    if not ce_model or not candidates: return candidates[:top_k]
+    if not ce_reranker or not candidates: return candidates[:top_k]
     
-    pairs = [[query, f"{c['name']} {c.get('desc','')}"] for c in candidates]
-    scores = ce_model.predict(pairs)
+    pairs = [(c['id'], f"{c['name']} {c.get('desc','')}", 0.0) for c in candidates]
+    ranked = ce_reranker.rerank(query, pairs, top_k=top_k)
     
-    # Attach scores and sort
-    scored_candidates = []
-    for c, s in zip(candidates, scores):
-        c_new = c.copy()
-        c_new['_ce_score'] = float(s)
-        scored_candidates.append(c_new)
-        
-    scored_candidates.sort(key=lambda x: x['_ce_score'], reverse=True)
-    return scored_candidates[:top_k]
+    # Attach scores (already sorted)
+    by_id = {c['id']: c for c in candidates}
+    return [{**by_id[cid], '_ce_score': score} for cid, score in ranked]
 
 # 2. LLM Reranker (Gemini)
 def rerank_llm(query, candidates, top_k=5, user_intent=None):
@@ -83,15 +84,10 @@ def rerank_llm(query, candidates, top_k=5, user_intent=None):
     
     try:
         start_time = time.time()
-        response = model.generate_content(prompt)
+        result = llm.generate_json(prompt)
         end_time = time.time()
         latency = end_time - start_time
         
-        text = response.text.strip()
-        if text.startswith("```json"): text = text[7:]
-        if text.endswith("```"): text = text[:-3]
-        result = json.loads(text)
-        
         # Add latency to result meta
         result['latency'] = latency
         
@@ -112,7 +108,8 @@ def rerank_llm(query, candidates, top_k=5, user_intent=None):
         return reranked[:top_k], result # Return meta result too
     except Exception as e:
         print(f"LLM Rerank Error: {e}")
-        return candidates[:top_k], {}
+        # Retrieval order stands in; flagged so a resumed eval re-runs the case
+        return candidates[:top_k], {"fallback": True}
 
 # ===========================
 # Experiment
@@ -127,16 +124,13 @@ def run_experiment():
         
     print(f"🧪 Testing AG Reranking on {len(cases)} cases...")
     
-    ce_score = 0
-    llm_score = 0
-    location_accuracy = 0
-    total = 0
+    cases = [case for case in cases if case.get('ground_truth_ids_hint')]
+    positions = {id(case): i for i, case in enumerate(cases)}
     
-    for case in cases:
+    # Runs concurrently on eval_runner worker threads (EVAL_CONCURRENCY / EVAL_RATE_PER_SEC)
+    def evaluate_case(case, timer):
         query = case['query']
         ground_truth = case.get('ground_truth_ids_hint', [])
-        if not ground_truth: continue
-        total += 1
         
         # Simulate retrieval (cheat: just pick ground truth + random noise)
         candidates = [PRODUCT_MAP[gid] for gid in ground_truth if gid in PRODUCT_MAP]
@@ -145,24 +139,43 @@ def run_experiment():
         candidates += noise
         
         # 1. Run CE
-        res_ce = rerank_cross_encoder(query, candidates, top_k=1)
-        if res_ce and res_ce[0]['id'] in ground_truth:
-            ce_score += 1
+        with timer.stage("cross_encoder"):
+            res_ce = rerank_cross_encoder(query, candidates, top_k=1)
+        ce_pass = bool(res_ce) and res_ce[0]['id'] in ground_truth
             
         # 2. Run LLM
-        res_llm, meta = rerank_llm(query, candidates, top_k=1, user_intent=case.get('expected_intent'))
-        if res_llm and res_llm[0]['id'] in ground_truth:
-            llm_score += 1
-            
+        with timer.stage("llm"):
+            res_llm, meta = rerank_llm(query, candidates, top_k=1, user_intent=case.get('expected_intent'))
+        llm_pass = bool(res_llm) and res_llm[0]['id'] in ground_truth
+        location_pass = False
+        if llm_pass:
             # Check location
             real_loc = res_llm[0]['location']
             guide_text = meta.get('location_guide_text', '')
-            if real_loc in guide_text:
-                location_accuracy += 1
+            location_pass = real_loc in guide_text
                 
-        print(f"Case {total}: Q='{query}' | CE={'✅' if res_ce and res_ce[0]['id'] in ground_truth else '❌'} | LLM={'✅' if res_llm and res_llm[0]['id'] in ground_truth else '❌'} | 🕒 {meta.get('latency', 0):.2f}s")
+        # One print per case so concurrent cases don't interleave
+        log = f"Case {positions[id(case)] + 1}: Q='{query}' | CE={'✅' if ce_pass else '❌'} | LLM={'✅' if llm_pass else '❌'} | 🕒 {meta.get('latency', 0):.2f}s"
         if meta and 'reason' in meta:
-            print(f"      💡 Reason: {meta['reason']}")
+            log += f"\n      💡 Reason: {meta['reason']}"
+        print(log)
+        
+        return {
+            "query": query,
+            "ce_pass": ce_pass,
+            "is_pass": llm_pass,
+            "location_pass": location_pass,
+            "fallback": bool(meta.get("fallback")),
+        }
+        
+    # LLM top-1 is the graded accuracy; run_eval also prints per-stage p50/p95
+    records = run_eval(cases, evaluate_case, "v2_step3", llm=llm, prompts=(rerank_llm,))
+    total = len(records)
+    ce_score = sum(1 for r in records if r.get('ce_pass'))
+    llm_score = sum(1 for r in records if r.get('is_pass'))
+    location_accuracy = sum(1 for r in records if r.get('location_pass'))
+    if not total:
+        return
         
     print("\n📊 Final Results")
     print(f"Total Evaluated: {total}")
@@ -1,7 +1,9 @@
 import json
 import os
+import random
 import time
-from poc_v5_experiment_phase_1 import advanced_rerank
+from poc_v5_experiment_phase_1 import SYSTEM_PROMPT, advanced_rerank, llm
+from eval_runner import run_eval, summarize
 
 # Configuration
 TEST_CASES_PATH = "data/poc_v5_golden_test_cases.json"
@@ -25,106 +27,105 @@ def run_evaluation():
     test_cases = load_test_cases()
     
     total = len(test_cases)
-    correct = 0
-    results = []
-    
-    start_time_all = time.time()
+    positions = {case['id']: i for i, case in enumerate(test_cases)}
 
-    for i, case in enumerate(test_cases):
+    # Runs concurrently on eval_runner worker threads (EVAL_CONCURRENCY / EVAL_RATE_PER_SEC)
+    def evaluate_case(case, timer):
         case_id = case['id']
+        i = positions[case_id]
         query = case['query']
         scenario = case['scenario_type']
         
-        # 1. Prepare Candidates (Simulation)
-        final_candidates = []
-        gt_ids = [str(gid) for gid in case.get('ground_truth_ids_hint', [])]
+        with timer.stage("candidates"):
+            # 1. Prepare Candidates (Simulation)
+            final_candidates = []
+            gt_ids = [str(gid) for gid in case.get('ground_truth_ids_hint', [])]
         
-        # Helper: Find product by ID with fallback name
-        def get_product_by_id(pid, hint_fallback=None):
-            if pid in product_map:
-                return product_map[pid]
-            # Improved Fallback: Use the hint name if available
-            name = hint_fallback if hint_fallback else f"Target Product {pid}"
-            desc = f"Simulated product description for {name}"
-            return {"id": pid, "name": name, "desc": desc}
+            # Helper: Find product by ID with fallback name
+            def get_product_by_id(pid, hint_fallback=None):
+                if pid in product_map:
+                    return product_map[pid]
+                # Improved Fallback: Use the hint name if available
+                name = hint_fallback if hint_fallback else f"Target Product {pid}"
+                desc = f"Simulated product description for {name}"
+                return {"id": pid, "name": name, "desc": desc}
 
-        # Helper: Find ID by Name hint (heuristic)
-        def find_product_by_hint_name(hint):
-            for pid, pdata in product_map.items():
-                if hint in pdata['name']:
-                    return pdata
-            return None
+            # Helper: Find ID by Name hint (heuristic)
+            def find_product_by_hint_name(hint):
+                for pid, pdata in product_map.items():
+                    if hint in pdata['name']:
+                        return pdata
+                return None
 
-        # [Step A] Explicitly Inject Ground Truth items first
-        existing_ids = set()
+            # [Step A] Explicitly Inject Ground Truth items first
+            existing_ids = set()
         
-        # Mapping: hint_string -> is_covered
-        # We assume strict 1:1 mapping by index for the first N hints where N = len(gt_ids)
-        covered_hints = set()
+            # Mapping: hint_string -> is_covered
+            # We assume strict 1:1 mapping by index for the first N hints where N = len(gt_ids)
+            covered_hints = set()
 
-        for idx, gid in enumerate(gt_ids):
-            # Try to align with a hint
-            aligned_hint = None
-            if idx < len(case['candidates_hint']):
-                aligned_hint = case['candidates_hint'][idx]
-                covered_hints.add(aligned_hint)
+            for idx, gid in enumerate(gt_ids):
+                # Try to align with a hint
+                aligned_hint = None
+                if idx < len(case['candidates_hint']):
+                    aligned_hint = case['candidates_hint'][idx]
+                    covered_hints.add(aligned_hint)
             
-            # Fetch GT Item
-            # Force Overwrite: The Test Case defines the "Truth" for this scenario.
-            # Even if DB has ID 301 as "Tupperware", if the Test Case implies it's "Insulation Sheet",
-            # we must present it as "Insulation Sheet" to the LLM to validate reasoning.
-            gt_item = get_product_by_id(gid)
+                # Fetch GT Item
+                # Force Overwrite: The Test Case defines the "Truth" for this scenario.
+                # Even if DB has ID 301 as "Tupperware", if the Test Case implies it's "Insulation Sheet",
+                # we must present it as "Insulation Sheet" to the LLM to validate reasoning.
+                gt_item = get_product_by_id(gid)
             
-            if aligned_hint:
-                # Force update name/desc to match the hint
-                gt_item = gt_item.copy() # Don't mutate global cache unique check
-                gt_item['name'] = aligned_hint
-                gt_item['desc'] = f"Simulated product description for {aligned_hint}"
+                if aligned_hint:
+                    # Force update name/desc to match the hint
+                    gt_item = gt_item.copy() # Don't mutate global cache unique check
+                    gt_item['name'] = aligned_hint
+                    gt_item['desc'] = f"Simulated product description for {aligned_hint}"
             
-            final_candidates.append(gt_item)
-            existing_ids.add(str(gt_item['id']))
+                final_candidates.append(gt_item)
+                existing_ids.add(str(gt_item['id']))
 
-        # [Step B] Add Distractors/Hints
-        for hint in case['candidates_hint']:
-            # If this hint was already used to map a GT, skip it
-            if hint in covered_hints:
-                continue
+            # [Step B] Add Distractors/Hints
+            for hint in case['candidates_hint']:
+                # If this hint was already used to map a GT, skip it
+                if hint in covered_hints:
+                    continue
                 
-            # Extra Check: Fuzzy coverage (for unmapped hints that might still overlap)
-            # e.g. if GT list has 1 item, but Hints have 2 items describing it? (Rare)
-            hint_clean = hint.replace(" ", "").lower()
-            is_covered_fuzzy = False
-            for c in final_candidates:
-                c_name_clean = c['name'].replace(" ", "").lower()
-                if hint_clean in c_name_clean or c_name_clean in hint_clean:
-                    is_covered_fuzzy = True
-                    break
+                # Extra Check: Fuzzy coverage (for unmapped hints that might still overlap)
+                # e.g. if GT list has 1 item, but Hints have 2 items describing it? (Rare)
+                hint_clean = hint.replace(" ", "").lower()
+                is_covered_fuzzy = False
+                for c in final_candidates:
+                    c_name_clean = c['name'].replace(" ", "").lower()
+                    if hint_clean in c_name_clean or c_name_clean in hint_clean:
+                        is_covered_fuzzy = True
+                        break
             
-            if is_covered_fuzzy:
-                continue
+                if is_covered_fuzzy:
+                    continue
             
-            # If not covered, try to find a real product in DB matching this hint
-            real_product = find_product_by_hint_name(hint)
-            if real_product:
-                 if str(real_product['id']) not in existing_ids:
-                     final_candidates.append(real_product)
-                     existing_ids.add(str(real_product['id']))
-            else:
-                 # Create Noise
-                 mock_item = {
-                    "id": f"NOISE_{abs(hash(hint))}", 
-                    "name": hint, 
-                    "desc": f"Description for {hint}"
-                 }
-                 final_candidates.append(mock_item)
+                # If not covered, try to find a real product in DB matching this hint
+                real_product = find_product_by_hint_name(hint)
+                if real_product:
+                     if str(real_product['id']) not in existing_ids:
+                         final_candidates.append(real_product)
+                         existing_ids.add(str(real_product['id']))
+                else:
+                     # Create Noise
+                     mock_item = {
+                        "id": f"NOISE_{abs(hash(hint))}", 
+                        "name": hint, 
+                        "desc": f"Description for {hint}"
+                     }
+                     final_candidates.append(mock_item)
                  
-        # Shuffle
-        import random
-        random.shuffle(final_candidates)
+            # Shuffle (seeded per case so resumed runs see the same order)
+            random.Random(case_id).shuffle(final_candidates)
         
         # 2. Run Reranker
-        print(f"[{i+1}/{total}] Query: {query} ({scenario})...", end="", flush=True)
-        result = advanced_rerank(query, final_candidates)
+        with timer.stage("rerank"):
+            result = advanced_rerank(query, final_candidates)
         
         prediction = str(result.get('selected_id')) if result.get('selected_id') else None
         reason = result.get('reason')
@@ -140,21 +141,20 @@ def run_evaluation():
         elif prediction in gt_ids:
             is_pass = True
             
-        if is_pass:
-            correct += 1
-            print(" ✅ PASS")
-        else:
-            print(f" ❌ FAIL (Pred: {prediction}, GT: {gt_ids})")
+        verdict = "✅ PASS" if is_pass else f"❌ FAIL (Pred: {prediction}, GT: {gt_ids})"
+        log = [f"[{i+1}/{total}] Query: {query} ({scenario})... {verdict}"]
 
         # DEBUG: Print Candidates for Case 02, 10, etc.
         if i < 20: 
-            print(f"\n[DEBUG TC_{i+1}] Query: {query}")
-            print(f"  GT IDs: {gt_ids}")
-            print(f"  Covered Hints: {covered_hints}")
+            log.append(f"\n[DEBUG TC_{i+1}] Query: {query}")
+            log.append(f"  GT IDs: {gt_ids}")
+            log.append(f"  Covered Hints: {covered_hints}")
             for c in final_candidates:
-                print(f"    - [{c['id']}] {c['name']}")
+                log.append(f"    - [{c['id']}] {c['name']}")
+        # One print per case so concurrent cases don't interleave
+        print("\n".join(log))
             
-        results.append({
+        return {
             "id": case_id,
             "query": query,
             "scenario": scenario,
@@ -162,28 +162,30 @@ def run_evaluation():
             "ground_truth": gt_ids,
             "is_pass": is_pass,
             "reason": reason,
-            "candidates_preview": [c['name'] for c in final_candidates]
-        })
-        
-        # Rate limit prevention
-        time.sleep(0.5)
+            "candidates_preview": [c['name'] for c in final_candidates],
+            "fallback": bool(result.get('fallback')),
+        }
 
-    duration = time.time() - start_time_all
-    accuracy = (correct / total) * 100
-    
-    print("-" * 60)
-    print(f"🏁 Evaluation Complete in {duration:.2f}s")
-    print(f"📊 Accuracy: {correct}/{total} ({accuracy:.1f}%)")
+    # Concurrency + per-request token bucket replace the fixed sleep; cache/eval_v5.jsonl checkpoints
+    results = run_eval(test_cases, evaluate_case, "v5", llm=llm, prompts=(SYSTEM_PROMPT, advanced_rerank))
+    summary = summarize(results)
     
     # Save Report
-    generate_report(results, accuracy)
+    generate_report(results, summary['accuracy'], summary['latency_ms'])
 
-def generate_report(results, accuracy):
+def generate_report(results, accuracy, latency_ms=None):
     with open(REPORT_PATH, "w", encoding="utf-8") as f:
         f.write("# PoC v5 Final Evaluation Report\n\n")
         f.write(f"- **Date**: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write(f"- **Accuracy**: **{accuracy:.1f}%**\n")
         f.write(f"- **Total Cases**: {len(results)}\n\n")
+
+        if latency_ms:
+            f.write("| Stage | p50 (ms) | p95 (ms) |\n")
+            f.write("|:---|---:|---:|\n")
+            for stage, values in latency_ms.items():
+                f.write(f"| {stage} | {values['p50']:.1f} | {values['p95']:.1f} |\n")
+            f.write("\n")
         
         f.write("## 1. Summary of Failures\n")
         failures = [r for r in results if not r['is_pass']]
@@ -193,14 +195,15 @@ def generate_report(results, accuracy):
             f.write("| ID | Query | Scenario | Prediction | GT | Reason |\n")
             f.write("|:---|:---|:---|:---|:---|:---|\n")
             for fail in failures:
-                f.write(f"| {fail['id']} | {fail['query']} | {fail['scenario']} | {fail['prediction']} | {fail['ground_truth']} | {fail['reason']} |\n")
+                # Errored cases only carry key + error
+                f.write(f"| {fail.get('id', fail['key'])} | {fail.get('query')} | {fail.get('scenario')} | {fail.get('prediction')} | {fail.get('ground_truth')} | {fail.get('reason', fail.get('error'))} |\n")
         
         f.write("\n## 2. Detailed Results\n")
         f.write("| ID | Query | Scenario | Result | LLM Reasoning |\n")
         f.write("|:---|:---|:---|:---|:---|\n")
         for r in results:
             icon = "🟢" if r['is_pass'] else "🔴"
-            f.write(f"| {r['id']} | {r['query']} | {r['scenario']} | {icon} | {r['reason']} |\n")
+            f.write(f"| {r.get('id', r['key'])} | {r.get('query')} | {r.get('scenario')} | {icon} | {r.get('reason', r.get('error'))} |\n")
             
     print(f"📄 Report saved to {REPORT_PATH}")
 